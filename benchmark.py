@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2013 Carlos (nzlosh@yahoo.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Benchmarks and conformance checks of tz2js.py.
+
+    ./benchmark.py synth DIR        write a synthetic tzdata directory from a fixed seed
+    ./benchmark.py parse TZPATH     parse throughput, peak memory and output size of each format
+    ./benchmark.py lookup TZPATH    lookup latency of every zone, offsets checked against zoneinfo
+
+The benchmark input is the directory synth writes with its default seed and
+sizes, several times the size of a release, a release tarball can be given
+as TZPATH too.
+"""
+
+# Required modules
+from __future__ import print_function, division
+import os, io, sys, gzip, time, random, calendar, datetime, logging, argparse, tempfile, subprocess
+
+# Optional, only the peak memory of the in process parse needs it.
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Optional, Python 3.9 and later, only the conformance check needs it.
+try:
+    import zoneinfo
+except ImportError:
+    zoneinfo = None
+
+import tz2js
+
+timer = getattr(time, "perf_counter", time.time)
+
+# tz2js.py options of each output format measured by the parse benchmark.
+output_formats = [
+    ("json", []),
+    ("packed", ["--format", "packed"]),
+    ("compiled", ["--compile"]),
+    ("compiled packed", ["--compile", "--format", "packed"]),
+    ("compiled index", ["--compile", "--index"]),
+]
+
+# Synthetic zones keep local mean time until a year from this one on.
+SYNTHETIC_LMT_FROM = 1880
+
+
+
+def formatOffset(seconds):
+    """
+    Format seconds as a tz database h:mm[:ss] time, e.g. -4:32:36.
+    """
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, seconds_part = divmod(rest, 60)
+    text = "%s%d:%02d" % (seconds < 0 and "-" or "", hours, minutes)
+    if seconds_part:
+        text += ":%02d" % seconds_part
+    return text
+
+
+def formatCoordinates(latitude, longitude):
+    """
+    Format decimal degrees as ISO 6709 +-DDMM+-DDDMM coordinates, as zone.tab has them.
+    """
+    fields = []
+    for value, width in ((latitude, 2), (longitude, 3)):
+        minutes = int(round(abs(value) * 60))
+        fields.append("%s%0*d%02d" % (value < 0 and "-" or "+", width, minutes // 60, minutes % 60))
+    return "".join(fields)
+
+
+def randomInt(rng, low, high):
+    """
+    random.randint and random.choice differ between Python 2 and 3, only
+    random.random gives the same sequence for a seed in both.
+    """
+    return low + int(rng.random() * (high - low + 1))
+
+
+def randomChoice(rng, items):
+    return items[randomInt(rng, 0, len(items) - 1)]
+
+
+def syntheticDayOn(rng):
+    choice = randomInt(rng, 0, 3)
+    if choice == 0:
+        return "last%s" % randomChoice(rng, tz2js.days)
+    if choice == 1:
+        return "%s>=%d" % (randomChoice(rng, tz2js.days), randomInt(rng, 1, 25))
+    if choice == 2:
+        return "%s<=%d" % (randomChoice(rng, tz2js.days), randomInt(rng, 7, 28))
+    return str(randomInt(rng, 1, 28))
+
+
+def syntheticTimeAt(rng):
+    return randomChoice(rng, ["0:00", "1:00", "2:00", "2:00s", "1:00u", "3:00", "24:00"])
+
+
+def writeSyntheticTzData(path, seed=1, zone_count=2000, rule_sets=500, rules_per_set=40, lines_per_zone=8):
+    """
+    Write a synthetic tz database to the directory path: zone.tab and each
+    of tz2js.zone_files, with rule_sets rule sets of rules_per_set rules,
+    zone_count zones of lines_per_zone zone lines and a Link to every tenth
+    zone.  The same seed and sizes always write the same files, whichever
+    the Python version.
+
+    Rule sets open with standard time and alternate a daylight saving start
+    and end over spans of years, the last span is usually open ended.  Zone
+    lines use a rule set, a fixed daylight saving or none, with the UNTIL
+    forms of the real data.  The files pass zic without errors.
+    """
+    rng = random.Random(seed)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    files = dict((filename, []) for filename in tz2js.zone_files)
+
+    rule_names = ["S%04d" % index for index in range(rule_sets)]
+    for index, name in enumerate(rule_names):
+        lines = files[tz2js.zone_files[index % len(tz2js.zone_files)]]
+        # Standard time from before any zone's LMT ends, so %s always has letters.
+        lines.append("Rule\t%s\t%d\tonly\t-\tJan\t1\t0:00\t0\tS" % (name, SYNTHETIC_LMT_FROM - 1))
+        year = randomInt(rng, 1900, 1980)
+        spans = max(rules_per_set // 2, 1)
+        for span in range(spans):
+            year_to = year + randomInt(rng, 0, 6)
+            if span == spans - 1 and rng.random() < 0.7:
+                to = "max"
+            else:
+                to = year_to == year and "only" or str(year_to)
+            for month, save, letters in ((randomChoice(rng, tz2js.months[2:5]), randomChoice(rng, ["1:00", "1:00", "0:30", "2:00"]), "D"),
+                                         (randomChoice(rng, tz2js.months[8:11]), "0", "S")):
+                lines.append("Rule\t%s\t%d\t%s\t-\t%s\t%s\t%s\t%s\t%s" % (name, year, to, month,
+                    syntheticDayOn(rng), syntheticTimeAt(rng), save, letters))
+            year = year_to + 1
+
+    zone_tab = []
+    for index in range(zone_count):
+        filename = tz2js.zone_files[index % len(tz2js.zone_files)]
+        name = "%s/Zone%05d" % (filename.capitalize(), index)
+        latitude, longitude = rng.random() * 160 - 80, rng.random() * 360 - 180
+        zone_tab.append("%s\t%s\t%s" % ("".join(randomChoice(rng, "ABCDEFGHIJKLMNOPQRSTUVWXYZ") for i in range(2)),
+            formatCoordinates(latitude, longitude), name))
+
+        # Local mean time of the longitude until the first standard time.
+        year = randomInt(rng, SYNTHETIC_LMT_FROM, 1920)
+        lines = files[filename]
+        lines.append("Zone\t%s\t%s\t-\tLMT\t%d" % (name, formatOffset(int(longitude * 240)), year))
+        # Real zones move between a few offsets, which also keeps the %z abbreviations
+        # of a long zone within what zic can store.
+        offsets = [formatOffset(randomInt(rng, -48, 56) * 900) for offset in range(4)]
+        for line in range(lines_per_zone - 1):
+            choice = randomInt(rng, 0, 3)
+            if choice < 2:
+                rules, zone_format = randomChoice(rng, rule_names), randomChoice(rng, ["X%sT", "XST/XDT"])
+            elif choice == 2 and line < lines_per_zone - 2:
+                # Never the last line, zic has no TZ string for a permanent daylight saving.
+                rules, zone_format = "1:00", "XDT"
+            else:
+                rules, zone_format = "-", randomChoice(rng, ["XST", "%z"])
+            fields = [randomChoice(rng, offsets), rules, zone_format]
+            if line < lines_per_zone - 2:
+                year += randomInt(rng, 1, 20)
+                until = [str(year), randomChoice(rng, tz2js.months), syntheticDayOn(rng), syntheticTimeAt(rng)]
+                fields.append(" ".join(until[:randomInt(rng, 1, 4)]))
+            lines.append("\t\t\t%s" % "\t".join(fields))
+        if index % 10 == 0:
+            files[filename].append("Link\t%s\t%s/Link%05d" % (name, filename.capitalize(), index))
+
+    for filename, lines in files.items():
+        with open(os.path.join(path, filename), "w") as fh:
+            fh.write("".join("%s\n" % line for line in lines))
+    with open(os.path.join(path, "zone.tab"), "w") as fh:
+        fh.write("# synthetic zone.tab, seed %d\n" % seed)
+        fh.write("".join("%s\n" % line for line in zone_tab))
+
+
+def bestTime(function, repeat):
+    """
+    Return the fewest seconds of repeat calls of function.
+    """
+    seconds = []
+    for run in range(repeat):
+        start = timer()
+        function()
+        seconds.append(timer() - start)
+    return max(min(seconds), 1e-9)
+
+
+def peakMemory(function):
+    """
+    Call function and return (its result, peak bytes allocated during the
+    call), the peak is None without tracemalloc.  Tracing slows the call,
+    it isn't timed.
+    """
+    if tracemalloc is None:
+        return function(), None
+    tracemalloc.start()
+    try:
+        result = function()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def runTz2js(tzpath, options, output):
+    """
+    Run tz2js.py in a child process writing to output.  Returns (seconds,
+    peak resident bytes or None where os.wait4 isn't available).
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tz2js.py"), tzpath, "--output", output] + options
+    errors = tempfile.TemporaryFile()
+    try:
+        start = timer()
+        process = subprocess.Popen(command, stderr=errors)
+        if hasattr(os, "wait4"):
+            status, usage = os.wait4(process.pid, 0)[1:]
+            process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+            # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+            peak = usage.ru_maxrss * (sys.platform == "darwin" and 1 or 1024)
+        else:
+            process.wait()
+            peak = None
+        seconds = timer() - start
+        if process.returncode != 0:
+            errors.seek(0)
+            raise RuntimeError("%s failed:\n%s" % (" ".join(command), tz2js.nativeString(errors.read())))
+    finally:
+        errors.close()
+    return seconds, peak
+
+
+def gzipSize(path):
+    buffer = io.BytesIO()
+    with open(path, "rb") as fh:
+        compressed = gzip.GzipFile(filename="", mode="wb", fileobj=buffer, mtime=0)
+        compressed.write(fh.read())
+        compressed.close()
+    return len(buffer.getvalue())
+
+
+def formatBytes(size):
+    return size is None and "-" or "%.1f" % (size / 1048576.0)
+
+
+def benchmarkParse(tzpath, window_options=(), repeat=3, out=sys.stdout):
+    """
+    Report the time, peak resident memory and output size of tz2js.py
+    writing each of output_formats, the throughput of parseZoneFile and
+    readRuleZoneFile on each file of tzpath, the best of repeat runs, and
+    the time and peak memory of parsing all of them.
+    """
+    # Run first, a child's peak resident memory includes its parent's at the fork.
+    print("%-16s %8s %9s %10s %10s" % ("format", "seconds", "peak MB", "bytes", "gzip bytes"), file=out)
+    output = tempfile.mkdtemp()
+    try:
+        for name, options in output_formats:
+            path = os.path.join(output, "tz.js")
+            seconds, peak = runTz2js(tzpath, list(options) + list(window_options), path)
+            print("%-16s %8.3f %9s %10d %10d" % (name, seconds, formatBytes(peak), os.path.getsize(path), gzipSize(path)), file=out)
+            os.remove(path)
+    finally:
+        os.rmdir(output)
+
+    source = tz2js.TzSource(tzpath)
+    try:
+        print("\n%-14s %8s %8s %10s %8s" % ("file", "lines", "seconds", "lines/s", "MB/s"), file=out)
+        for filename in ["zone.tab"] + tz2js.zone_files:
+            tz_file = source.open(filename)
+            content = tz_file.read()
+            tz_file.close()
+            if filename == "zone.tab":
+                parse = lambda: tz2js.parseZoneFile(source)
+            else:
+                lines = [tz2js.nativeString(line) for line in content.splitlines(True)]
+                parse = lambda: tz2js.readRuleZoneFile(lines)
+            best = bestTime(parse, repeat)
+            line_count = content.count(b"\n")
+            print("%-14s %8d %8.4f %10d %8.2f" % (filename, line_count, best, line_count / best, len(content) / best / 1048576), file=out)
+
+        seconds = bestTime(lambda: tz2js.parseTzData(source), repeat)
+        (zones, rules), peak = peakMemory(lambda: tz2js.parseTzData(source))
+        print("\nparseTzData: %.4f seconds, %s MB peak allocated, %d rule sets" % (seconds, formatBytes(peak), len(rules)), file=out)
+    finally:
+        source.close()
+
+
+def referenceZones():
+    """
+    Return the zoneinfo names by their lower case name, tz2js.py only
+    keeps the lower case names.
+    """
+    if zoneinfo is None:
+        return {}
+    return dict((name.lower(), name) for name in zoneinfo.available_timezones())
+
+
+def benchmarkLookup(tzpath, year_from, year_to, step, slowest=10, out=sys.stdout):
+    """
+    Look up the UTC offset of every zone of tzpath every step seconds from
+    the start of year_from to the end of year_to, timing the compile and
+    the lookups of each zone, and check the offsets against zoneinfo for
+    the zones it knows.  Returns the number of mismatching offsets.
+
+    The offsets only agree when zoneinfo's data is the same release as
+    tzpath, see zoneinfo.TZPATH.
+    """
+    db = tz2js.TzDatabase(tzpath, year_from, year_to)
+    names = sorted(tz2js.zoneName(area, location) for area in db.zones for location in db.zones[area])
+    start = calendar.timegm((year_from, 1, 1, 0, 0, 0))
+    end = calendar.timegm((year_to + 1, 1, 1, 0, 0, 0))
+    timestamps = list(range(start, end, step))
+    reference_names = referenceZones()
+
+    totals = dict(compile=0.0, lookup=0.0, lookupArray=0.0, zoneinfo=0.0)
+    latencies = []
+    empty = []
+    unchecked = []
+    checked = 0
+    mismatches = []
+    for name in names:
+        try:
+            begin = timer()
+            db.getTransitions(name)
+            totals["compile"] += timer() - begin
+            db.lookup(name, start)
+        except KeyError:
+            empty.append(name)
+            continue
+
+        utcoffset = db.utcoffset
+        begin = timer()
+        offsets = [utcoffset(name, timestamp) for timestamp in timestamps]
+        seconds = timer() - begin
+        totals["lookup"] += seconds
+        latencies.append( (seconds / len(timestamps), name) )
+
+        if tz2js.numpy is not None:
+            array = tz2js.numpy.array(timestamps, dtype=tz2js.numpy.int64)
+            begin = timer()
+            db.lookupArray(name, array)
+            totals["lookupArray"] += timer() - begin
+
+        if name not in reference_names:
+            unchecked.append(name)
+            continue
+        zone_info = zoneinfo.ZoneInfo(reference_names[name])
+        fromtimestamp = datetime.datetime.fromtimestamp
+        begin = timer()
+        reference = [fromtimestamp(timestamp, zone_info).utcoffset() for timestamp in timestamps]
+        totals["zoneinfo"] += timer() - begin
+        checked += 1
+        for timestamp, offset, expected in zip(timestamps, offsets, reference):
+            expected = expected.days * 86400 + expected.seconds
+            if offset != expected:
+                mismatches.append( (name, timestamp, offset, expected) )
+
+    lookups = len(timestamps) * len(latencies)
+    print("%d zones, %d without data, %d instants each from %d to %d" % (len(names), len(empty), len(timestamps), year_from, year_to), file=out)
+    print("%-12s %9.3f seconds" % ("compile", totals["compile"]), file=out)
+    for key in ("lookup", "lookupArray", "zoneinfo"):
+        if totals[key]:
+            count = key == "zoneinfo" and len(timestamps) * checked or lookups
+            print("%-12s %9.3f seconds %9.1f ns/lookup" % (key, totals[key], totals[key] / max(count, 1) * 1e9), file=out)
+
+    if slowest:
+        print("\nslowest zones:", file=out)
+        for seconds, name in sorted(latencies, reverse=True)[:slowest]:
+            print("%9.1f ns/lookup %s" % (seconds * 1e9, name), file=out)
+
+    if zoneinfo is None:
+        print("\nzoneinfo isn't available, offsets not checked", file=out)
+    else:
+        print("\n%d zones checked against zoneinfo, %d not in zoneinfo, %d mismatching offsets" % (checked, len(unchecked), len(mismatches)), file=out)
+        for name, timestamp, offset, expected in mismatches[:slowest]:
+            print("%s %s offset %d zoneinfo %d" % (name, datetime.datetime.utcfromtimestamp(timestamp).isoformat(), offset, expected), file=out)
+    return len(mismatches)
+
+
+def main():
+    # tz2js.py warns of every zone missing from zone.tab, only errors matter here.
+    logging.basicConfig( level=logging.ERROR )
+
+    parser = argparse.ArgumentParser(description="Benchmarks and conformance checks of tz2js.py.")
+    commands = parser.add_subparsers(dest="command")
+
+    synth = commands.add_parser("synth", help="write a synthetic tzdata directory, the same seed always writes the same files")
+    synth.add_argument("path", help="directory to write the tzdata files to")
+    synth.add_argument("--seed", type=int, default=1, help="random seed (default: %(default)s)")
+    synth.add_argument("--zones", type=int, default=2000, metavar="N", help="number of zones (default: %(default)s)")
+    synth.add_argument("--rule-sets", type=int, default=500, metavar="N", help="number of rule sets (default: %(default)s)")
+    synth.add_argument("--rules-per-set", type=int, default=40, metavar="N", help="rules in each rule set (default: %(default)s)")
+    synth.add_argument("--lines-per-zone", type=int, default=8, metavar="N", help="zone lines of each zone (default: %(default)s)")
+
+    for name, help_text in (("parse", "parse throughput, peak memory and output size of each format"),
+                            ("lookup", "lookup latency of every zone, offsets checked against zoneinfo")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("tzpath", help="path to tzdata directory or tzdata release tarball")
+        command.add_argument("--from-year", type=int, metavar="YEAR",
+            help="first year of the window, defaults to the current year")
+        command.add_argument("--to-year", type=int, default=tz2js.DEFAULT_TO_YEAR, metavar="YEAR",
+            help="last year of the window (default: %(default)s)")
+    commands.choices["parse"].add_argument("--repeat", type=int, default=3, metavar="N",
+        help="parse each file N times and report the best (default: %(default)s)")
+    commands.choices["lookup"].add_argument("--step", type=int, default=7 * 86400 + 3 * 3600 + 7, metavar="SECONDS",
+        help="seconds between the looked up instants, odd so every time of day is hit (default: %(default)s)")
+    commands.choices["lookup"].add_argument("--slowest", type=int, default=10, metavar="N",
+        help="report the N slowest zones and the first N mismatches (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "synth":
+        writeSyntheticTzData(args.path, args.seed, args.zones, args.rule_sets, args.rules_per_set, args.lines_per_zone)
+    elif args.command == "parse":
+        window_options = ["--to-year", str(args.to_year)]
+        if args.from_year is not None:
+            window_options += ["--from-year", str(args.from_year)]
+        benchmarkParse(args.tzpath, window_options, args.repeat)
+    elif args.command == "lookup":
+        year_from = args.from_year if args.from_year is not None else tz2js.referenceYear()
+        if benchmarkLookup(args.tzpath, year_from, args.to_year, args.step, args.slowest):
+            sys.exit(1)
+    else:
+        parser.error("a command is required")
+
+
+if __name__ == "__main__":
+    main()
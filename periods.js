@@ -144,10 +144,397 @@ function objectAsString(o) {
  * isLeap
  * ======
  * Returns 0 for non leap years or 1 for leap years.
- * Note: This code is valid until 2099, 2100 isn't a leap year.
 */
 function isLeap(year) {
-    return year % 4 ? 0 : 1;
+    return (year % 4 == 0 && year % 100 != 0) || year % 400 == 0 ? 1 : 0;
+}
+/**********************************************************************
+ * resolveDayOn
+ * ============
+ * Resolve a Rule ON field to its day of the month in the given year with
+ * calendar arithmetic.  Only used when the data doesn't carry the days
+ * tz2js.py resolved for each year of the rule.
+ *
+ * @day: day of the week, as a name or javascript's 0 (Sunday) to 6.
+ * @cmp: ">=", "<=" or undefined for a fixed day of the month.
+ * @dom: day of the month or "last".
+ *
+ * The result may fall outside the month (Sun>=29), Date.UTC carries it over.
+*/
+function resolveDayOn(year, mon, day, cmp, dom) {
+    if ( isString(dom) && dom.match("^last") ) {
+        dom = months[mon - 1]["maxdays"] + (mon == 2 ? isLeap(year) : 0);
+    }
+    dom = parseInt(dom);
+    if ( cmp != ">=" && cmp != "<=" ) {
+        return dom;
+    }
+    if ( isString(day) ) {
+        day = days[day.toLowerCase().substr(0, 3)];
+    }
+    var weekday = new Date(Date.UTC(year, mon - 1, dom)).getUTCDay();
+    if ( cmp == ">=" ) {
+        return dom + (day - weekday + 7) % 7;
+    }
+    return dom - (weekday - day + 7) % 7;
+}
+/**********************************************************************
+ * formatAbbreviation
+ * ==================
+ * Expand a Zone FORMAT field into the abbreviation in effect, the same way
+ * tz2js.py does for compiled transitions.  Handles the "CE%sT", "GMT/BST"
+ * and "%z" forms.
+ *
+ * @letters: the LETTER/S of the rule in effect.
+ * @gmt_off: the zone's UTC offset in seconds.
+ * @save: the daylight savings offset in seconds.
+*/
+function formatAbbreviation(zone_format, letters, gmt_off, save) {
+    if ( zone_format.indexOf("/") != -1 ) {
+        return zone_format.split("/")[save != 0 ? 1 : 0];
+    }
+    if ( zone_format.indexOf("%s") != -1 ) {
+        return zone_format.replace("%s", letters);
+    }
+    if ( zone_format.indexOf("%z") != -1 ) {
+        var offset = gmt_off + save;
+        var rest = Math.abs(offset);
+        var pad = function(n) { return (n < 10 ? "0" : "") + n; };
+        var numeric = (offset < 0 ? "-" : "+") + pad(Math.floor(rest / 3600));
+        if ( rest % 3600 ) {
+            numeric += pad(Math.floor(rest % 3600 / 60));
+        }
+        if ( rest % 60 ) {
+            numeric += pad(rest % 60);
+        }
+        return zone_format.replace("%z", numeric);
+    }
+    return zone_format;
+}
+
+/**********************************************************************
+ * findTransition
+ * ==============
+ * Binary search a zone's compiled transitions for the one in effect at the
+ * given UTC time in seconds.
+ *
+ * @zone_transitions: sorted array of [utc, offset, save, abbreviation index].
+ * @utc: seconds since midnight 1st Jan 1970 UTC.
+ * @zone_index: the zone's transition_index string of tz2js.py --index, if any.
+ *
+ * Times before the first transition use the first transition.
+ *
+ * With the index, the bucket of utc holds the transition in effect at its
+ * start as a character code (+48).  Only a bucket which contains a
+ * transition needs a step or two further, outside the index the binary
+ * search is used.
+*/
+function findTransition(zone_transitions, utc, zone_index) {
+    if ( zone_index ) {
+        var bucket = Math.floor((utc - transition_index_start) / transition_index_stride);
+        if ( bucket >= 0 && bucket < zone_index.length ) {
+            var i = zone_index.charCodeAt(bucket) - 48;
+            while ( i + 1 < zone_transitions.length && zone_transitions[i+1][0] <= utc ) {
+                i++;
+            }
+            return i;
+        }
+    }
+    var lo = 0;
+    var hi = zone_transitions.length - 1;
+    while ( lo < hi ) {
+        var mid = (lo + hi + 1) >> 1;
+        if ( zone_transitions[mid][0] <= utc ) {
+            lo = mid;
+        } else {
+            hi = mid - 1;
+        }
+    }
+    return lo;
+}
+/**********************************************************************
+ * nextTransition
+ * ==============
+ * Return the next UTC instant, in milliseconds, after utc_ms at which the
+ * zone's offset or abbreviation may change.  Infinity when the data holds
+ * no later transition.  Results which depend only on the zone's offset
+ * can be kept until then.  Compiled data (tz2js.py --compile) gives the
+ * exact transitions.  Raw rules give the same state and an instant which
+ * can come early, except at zone line ends with a "u" or "s" UNTIL time,
+ * which the data doesn't carry: cache across those with --compile data.
+ *
+ * @tz: String : timezone, as accepted by tzDate.
+ * @utc_ms: milliseconds since midnight 1st Jan 1970 UTC.
+*/
+function nextTransition(tz, utc_ms) {
+    return tzDateFromUTC(utc_ms, tz).getNextTransition();
+}
+/**********************************************************************
+ * tzDateFromUTC
+ * =============
+ * Create the tzDate of the zone's wall clock time at a UTC instant.
+ * tzDate expects wall clock time, a first pass finds the offset to reach it
+ * and whether daylight savings is in effect, which settles the repeated hour
+ * when the clocks go back.
+*/
+function tzDateFromUTC(utc_ms, tz) {
+    var d = new Date(utc_ms);
+    var wall = new tzDate(d.getUTCFullYear(), d.getUTCMonth(), d.getUTCDate(), d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds(), d.getUTCMilliseconds(), tz);
+    if ( typeof transitions != "undefined" ) {
+        // Compiled transitions give the exact state at the UTC instant.
+        var zone_transitions = transitions[wall.zone_name[0]][wall.zone_name[1]];
+        var t = zone_transitions[findTransition(zone_transitions, utc_ms / 1000, wall.zone_index)];
+        d = new Date(utc_ms + t[1] * 1000);
+        return new tzDate(d.getUTCFullYear(), d.getUTCMonth(), d.getUTCDate(), d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds(), d.getUTCMilliseconds(), tz, t[2] != 0);
+    }
+    // The rules' UTC instants give the daylight savings at utc_ms.  Near a change of
+    // zone line the first pass may have used the other line: the date found is used for
+    // another pass until it leads back to utc_ms, on the next line once the line has ended.
+    var zone_line = undefined;
+    for ( var pass = 0; pass < 4; pass++ ) {
+        var save = wall.getSaveAt(utc_ms);
+        d = new Date(utc_ms + wall.zone.getUTCOffset() + save);
+        wall = Object.create(tzDate.prototype);
+        wall.zone_line = zone_line;
+        tzDate.call(wall, d.getUTCFullYear(), d.getUTCMonth(), d.getUTCDate(), d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds(), d.getUTCMilliseconds(), tz, save != 0);
+        if ( utc_ms >= wall.getZoneLineEnd() ) {
+            zone_line = wall.zone_line + 1;
+        } else if ( wall.utc_ms - wall.getUTCOffset() == utc_ms ) {
+            break;
+        }
+    }
+    return wall;
+}
+
+/**********************************************************************
+ * unpackValues
+ * ============
+ * Decode a string written by tz2js.py --format packed into an array.
+ * Tokens are comma separated base 36 integers, "$" followed by the base 36
+ * index of a string in tz_strings, or empty for null.
+*/
+function unpackValues(packed) {
+    var values = [];
+    if ( packed == "" ) {
+        return values;
+    }
+    var tokens = packed.split(",");
+    for ( var i = 0; i < tokens.length; i++ ) {
+        if ( tokens[i] == "" ) {
+            values.push(null);
+        } else if ( tokens[i].charAt(0) == "$" ) {
+            values.push(tz_strings[parseInt(tokens[i].substr(1), 36)]);
+        } else {
+            values.push(parseInt(tokens[i], 36));
+        }
+    }
+    return values;
+}
+/**********************************************************************
+ * unpackZone
+ * ==========
+ * Decode a packed zone into its array of zone lines.  The gmt_off and
+ * until, as naive seconds, are delta encoded against the previous line.
+*/
+function unpackZone(packed) {
+    var v = unpackValues(packed);
+    var zone = [];
+    var gmt_off = 0;
+    var until = 0;
+    for ( var i = 0; i < v.length; i += 6 ) {
+        gmt_off += v[i+2];
+        until += v[i+5];
+        var d = new Date(until * 1000);
+        zone.push({area: v[i], location: v[i+1], gmt_off: gmt_off, rules: v[i+3], zone_format: v[i+4],
+                   until: [d.getUTCFullYear(), d.getUTCMonth() + 1, d.getUTCDate(), d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds()]});
+    }
+    return zone;
+}
+/**********************************************************************
+ * unpackRules
+ * ===========
+ * Decode a packed rule set into its array of rules.  year_from is delta
+ * encoded against the previous rule and year_to against year_from.  days,
+ * when present, holds the resolved day of the month for each year as one
+ * base 36 digit.
+*/
+function unpackRules(packed) {
+    var v = unpackValues(packed);
+    var rule_set = [];
+    var year = 0;
+    for ( var i = 0; i < v.length; i += 13 ) {
+        year += v[i+1];
+        var rule_days = null;
+        if ( v[i+12] != null ) {
+            rule_days = [];
+            for ( var d = 0; d < v[i+12].length; d++ ) {
+                rule_days.push(parseInt(v[i+12].charAt(d), 36));
+            }
+        }
+        rule_set.push({name: v[i], year_from: year, year_to: year + v[i+2], month_in: v[i+3],
+                       day_on: v.slice(i+4, i+7), time_at: v.slice(i+7, i+9), rule_type: v[i+9],
+                       save: v[i+10], letters: v[i+11], days: rule_days});
+    }
+    return rule_set;
+}
+/**********************************************************************
+ * unpackTransitions
+ * =================
+ * Decode packed transitions into [utc, offset, save, abbreviation] arrays.
+ * The UTC instants are delta encoded against the previous transition and
+ * the abbreviation is an index into tz_abbreviations.
+*/
+function unpackTransitions(packed) {
+    var v = unpackValues(packed);
+    var zone_transitions = [];
+    var utc = 0;
+    for ( var i = 0; i < v.length; i += 4 ) {
+        utc += v[i];
+        zone_transitions.push([utc, v[i+1], v[i+2], v[i+3]]);
+    }
+    return zone_transitions;
+}
+/**********************************************************************
+ * nearestZone
+ * ===========
+ * Return the name of the zone whose zone.tab location is closest to the
+ * coordinates in decimal degrees, e.g. nearestZone(48.85, 2.35) is
+ * "europe/paris".  Requires the zone_locations of tz2js.py --locations,
+ * rows of [name, country code, latitude, longitude] in seconds of arc laid
+ * out as an implicit k-d tree over points on the unit sphere: the root of
+ * the range [lo, hi) is at (lo + hi) >> 1 and splits on axis depth % 3.
+*/
+var zone_points = undefined;
+function toPoint(latitude, longitude) {
+    latitude = latitude * Math.PI / 180;
+    longitude = longitude * Math.PI / 180;
+    return [Math.cos(latitude) * Math.cos(longitude), Math.cos(latitude) * Math.sin(longitude), Math.sin(latitude)];
+}
+function nearestZone(latitude, longitude) {
+    if ( zone_points == undefined || zone_points.length != zone_locations.length ) {
+        zone_points = [];
+        for ( var i = 0; i < zone_locations.length; i++ ) {
+            zone_points.push(toPoint(zone_locations[i][2] / 3600, zone_locations[i][3] / 3600));
+        }
+    }
+    var target = toPoint(latitude, longitude);
+    var best = undefined;
+    var best_distance = 5;      // Squared chord lengths are at most 4.
+    // Ranges still to search, with the squared distance to their side of the split.
+    var stack = [[0, zone_points.length, 0, 0]];
+    while ( stack.length ) {
+        var range = stack.pop();
+        var lo = range[0], hi = range[1], depth = range[2];
+        if ( lo >= hi || range[3] >= best_distance ) {
+            continue;
+        }
+        var middle = (lo + hi) >> 1;
+        var point = zone_points[middle];
+        var distance = Math.pow(point[0] - target[0], 2) + Math.pow(point[1] - target[1], 2) + Math.pow(point[2] - target[2], 2);
+        if ( distance < best_distance ) {
+            best = middle;
+            best_distance = distance;
+        }
+        var delta = target[depth % 3] - point[depth % 3];
+        if ( delta < 0 ) {
+            stack.push([middle + 1, hi, depth + 1, delta * delta]);
+            stack.push([lo, middle, depth + 1, 0]);
+        } else {
+            stack.push([lo, middle, depth + 1, delta * delta]);
+            stack.push([middle + 1, hi, depth + 1, 0]);
+        }
+    }
+    return best == undefined ? undefined : zone_locations[best][0];
+}
+/**********************************************************************
+ * zonesForCountry
+ * ===============
+ * Return the names of the zones of an ISO 3166 country code, e.g. "NZ",
+ * in the order of zone_locations.
+*/
+function zonesForCountry(country_code) {
+    var names = [];
+    for ( var i = 0; i < zone_locations.length; i++ ) {
+        if ( zone_locations[i][1] == country_code.toUpperCase() ) {
+            names.push(zone_locations[i][0]);
+        }
+    }
+    return names;
+}
+/**********************************************************************
+ * applyPatch
+ * ==========
+ * Apply a patch emitted by tz2js.py --delta-from over the loaded data.
+ * Added and changed entries replace the data's, null removes them.
+ * Packed entries are decoded with the patch's own string table and
+ * abbreviation indexes are moved into tz_abbreviations.
+ *
+ * Patches queued in tz_patches are applied, in order, when periods.js is
+ * loaded after them.
+*/
+function applyPatch(patch) {
+    var merge = function(data, changes, decode) {
+        for ( var key in changes ) {
+            if ( ! changes.hasOwnProperty(key) ) {
+                continue;
+            }
+            if ( changes[key] == null ) {
+                delete data[key];
+            } else {
+                data[key] = decode(changes[key]);
+            }
+        }
+    };
+    var mergeAreas = function(data, changes, decode) {
+        for ( var area in changes ) {
+            if ( ! changes.hasOwnProperty(area) ) {
+                continue;
+            }
+            if ( data[area] == undefined ) {
+                data[area] = {};
+            }
+            merge(data[area], changes[area], decode);
+        }
+    };
+    var unpacked = function(unpack) {
+        return function(value) { return isString(value) ? unpack(value) : value; };
+    };
+
+    // Packed values refer to the patch's strings, the data's own are restored afterwards.
+    var strings = typeof tz_strings == "undefined" ? undefined : tz_strings;
+    tz_strings = patch.tz_strings;
+
+    merge(links, patch.links, function(value) { return value; });
+    if ( patch.zone_locations != undefined ) {
+        zone_locations = patch.zone_locations;
+        zone_points = undefined;
+    }
+    if ( patch.transitions != undefined ) {
+        mergeAreas(transitions, patch.transitions, function(value) {
+            var zone_transitions = unpacked(unpackTransitions)(value);
+            for ( var i = 0; i < zone_transitions.length; i++ ) {
+                var abbreviation = patch.tz_abbreviations[zone_transitions[i][3]];
+                var index = tz_abbreviations.indexOf(abbreviation);
+                if ( index == -1 ) {
+                    index = tz_abbreviations.push(abbreviation) - 1;
+                }
+                zone_transitions[i][3] = index;
+            }
+            return zone_transitions;
+        });
+        // A changed zone's bucket index is replaced by the patch's, or dropped for the binary search.
+        if ( typeof transition_index != "undefined" ) {
+            mergeAreas(transition_index, patch.transitions, function(value) { return null; });
+            if ( patch.transition_index != undefined ) {
+                mergeAreas(transition_index, patch.transition_index, function(value) { return value; });
+            }
+        }
+    } else {
+        mergeAreas(zones, patch.zones, unpacked(unpackZone));
+        merge(rules, patch.rules, unpacked(unpackRules));
+    }
+
+    tz_strings = strings;
 }
 
 /***********************************************************************
@@ -203,6 +590,9 @@ function Period(kwargs){
         tz: "europe/paris"
     };
     this.period_match = false;
+    // The verdict holds from checked_at until valid_until (UTC milliseconds).
+    this.checked_at = undefined;
+    this.valid_until = undefined;
 
     // Merge supplied arguments into default argument set
     var tmp_s = "";
@@ -231,13 +621,16 @@ Period.prototype.toString = function toString() {
 * checkDate
  * =========
  * Given a date/time with timezone extensions, determine if it falls within
- * the boundaries of the Period's constraints.
+ * the boundaries of the Period's constraints.  The verdict is kept until the
+ * next period boundary or offset transition, whichever comes first.
+ *
+ * @now_ms: UTC milliseconds to check.  Default: the current time.
 */
-Period.prototype.checkDate = function checkDate()
+Period.prototype.checkDate = function checkDate(now_ms)
 {
     // Create a timezone aware date/time from UTC time.
-    var now = new Date();
-    var check_time = new tzDate(now.getUTCFullYear(), now.getUTCMonth(), now.getUTCDate(), now.getUTCHours(), now.getUTCMinutes(), now.getUTCSeconds(), now.getUTCMilliseconds(), this.default_period.tz);
+    var now = new Date(now_ms == undefined ? Date.now() : now_ms);
+    var check_time = tzDateFromUTC(now.getTime(), this.default_period.tz);
 
     // compare the date with the period definition working for largest
     // time unit to smallest.
@@ -247,9 +640,41 @@ Period.prototype.checkDate = function checkDate()
     // if the date matches set matched to TRUE
     this.period_match = true;
 
+    this.checked_at = now.getTime();
+    this.valid_until = Math.min(this.nextBoundary(now.getTime(), check_time.getUTCOffset()),
+                                check_time.getNextTransition());
 }
-Period.prototype.inProgress = function inProgress(){
-    this.checkDate();
+/**********************************************************************
+ * nextBoundary
+ * ============
+ * The next UTC instant, in milliseconds, after now_ms at which the time of
+ * day enters or leaves the period's time range, or the day changes.  The
+ * day, week, month and year constraints can only change at midnight.
+ *
+ * @offset: the zone's UTC offset in milliseconds at now_ms.
+*/
+Period.prototype.nextBoundary = function nextBoundary(now_ms, offset) {
+    var time = this.default_period["time"];
+    var wall = now_ms + offset;
+    var midnight = wall - ((wall % 86400000) + 86400000) % 86400000;
+    var edges = [midnight + time[0], midnight + time[1] + 1, midnight + 86400000];
+    for ( var i = 0; i < edges.length; i++ ) {
+        if ( edges[i] > wall ) {
+            return edges[i] - offset;
+        }
+    }
+}
+/**********************************************************************
+ * inProgress
+ * ==========
+ * Returns true when now_ms (default: the current time) falls within the
+ * period.  The date is only checked again once the previous verdict expires.
+*/
+Period.prototype.inProgress = function inProgress(now_ms){
+    var now = now_ms == undefined ? Date.now() : now_ms;
+    if ( this.valid_until == undefined || now < this.checked_at || now >= this.valid_until ) {
+        this.checkDate(now);
+    }
     return this.period_match;
 }
 /**********************************************************************
@@ -627,19 +1052,36 @@ function tzDate( Y, M, D, h, m, s, ms, tz, is_dst) {
         this.zone = undefined;
         this.dst_off = undefined;
         this.zone_dst_abbr = undefined;
+        this.abbreviation = undefined;
+        this.next_transition = undefined;
+
+        if ( typeof transitions != "undefined" ) {
+            // Compiled transitions (tz2js.py --compile) already hold the UTC offset,
+            // daylight savings and abbreviation, no rule expansion is required.
+            this.parseTransition(tz, is_dst);
+
+            // Advance towards the correct UTC timestamp by removing the timezone offset.
+            this.localtime = new Date( this.utc_ms - this.zone.getUTCOffset());
+        } else {
+            // Match timezone area/location and set its UTC offset and abbreviation.
+            this.parseZone(tz);
 
-        // Match timezone area/location and set its UTC offset and abbreviation.
-        this.parseZone(tz);
+            // Advance towards the correct UTC timestamp by removing the timezone offset.
+            this.localtime = new Date( this.utc_ms - this.zone.getUTCOffset());
 
-        // Advance towards the correct UTC timestamp by removing the timezone offset.
-        this.localtime = new Date( this.utc_ms - this.zone.getUTCOffset());
+            // Determine the daylight savings time and modification of the zone abbreviation
+            this.parseDstRule(is_dst);
 
-        // Determine the daylight savings time and modification of the zone abbreviation
-        this.parseDstRule();
+            // Format the abbreviation once, rather than each time it's displayed.
+            this.abbreviation = formatAbbreviation(this.zone.getAbbreviation(), this.zone_dst_abbr,
+                                                   this.zone.getUTCOffset() / 1000, this.dst_off / 1000);
+        }
     } else {
         this.zone = new Zone({gmt_off: 0, zone_format: "UTC"});
         this.dst_off = 0;
         this.zone_dst_abbr = "UTC";
+        this.abbreviation = "UTC";
+        this.next_transition = Infinity;
     }
     // Remove the daylight savings offset from UTC.
     log.debug("Before DST offset: " +[this.localtime.getTime(), this.dst_off]);
@@ -648,15 +1090,90 @@ function tzDate( Y, M, D, h, m, s, ms, tz, is_dst) {
 
 }
 /**********************************************************************/
-tzDate.prototype.parseZone = function parseZone(tz) {
+tzDate.prototype.splitZoneName = function splitZoneName(tz) {
     if ( ! isString(tz) ) {
         throw "Timezone must be of type string but received " + getType(tz);
     }
     if ( tz.indexOf("/") == -1 ) {
         throw "Unexpected timezone string format: " + tz + " ... expected 'area/location' string.";
     }
-    res = tz.toLowerCase().splitOnFirst("/");
-    this.zone = new Zone(zones[res[0]][res[1]][0]);
+    // Links are emitted as aliases of the zone they share their data with.
+    if ( typeof links != "undefined" && links.hasOwnProperty(tz.toLowerCase()) ) {
+        return links[tz.toLowerCase()];
+    }
+    return tz.toLowerCase().splitOnFirst("/");
+}
+/**********************************************************************/
+tzDate.prototype.parseZone = function parseZone(tz) {
+    res = this.splitZoneName(tz);
+    // Packed zones are decoded on first use and kept for later lookups.
+    if ( isString(zones[res[0]][res[1]]) ) {
+        zones[res[0]][res[1]] = unpackZone(zones[res[0]][res[1]]);
+    }
+    // Zone lines are in chronological order, the first one still in effect at
+    // the wall clock date/time is used.  With --full-history there may be many.
+    // tzDateFromUTC sets zone_line beforehand when the UTC instant settles it.
+    var zone_lines = zones[res[0]][res[1]];
+    var i = 0;
+    if ( this.zone_line != undefined ) {
+        i = Math.min(this.zone_line, zone_lines.length - 1);
+    }
+    while ( this.zone_line == undefined && i < zone_lines.length - 1 ) {
+        var u = zone_lines[i].until;
+        if ( Date.UTC(u[0], u[1] - 1, u[2], u[3], u[4], u[5]) > this.utc_ms ) {
+            break;
+        }
+        i++;
+    }
+    this.zone_line = i;
+    this.zone = new Zone(zone_lines[i]);
+    // The last zone line's until only marks the end of the data.
+    this.last_zone_line = i == zone_lines.length - 1;
+}
+/**********************************************************************
+ * parseTransition
+ * ===============
+ * Set the zone, daylight savings offset and abbreviation from the compiled
+ * transitions.  The date/time is wall clock time, so the transition is
+ * searched for a second time once the UTC offset is known.
+ */
+tzDate.prototype.parseTransition = function parseTransition(tz, is_dst) {
+    var res = this.splitZoneName(tz);
+    this.zone_name = res;
+    if ( isString(transitions[res[0]][res[1]]) ) {
+        transitions[res[0]][res[1]] = unpackTransitions(transitions[res[0]][res[1]]);
+    }
+    var zone_transitions = transitions[res[0]][res[1]];
+    this.zone_index = typeof transition_index == "undefined" ? undefined : transition_index[res[0]][res[1]];
+
+    var t = zone_transitions[findTransition(zone_transitions, this.utc_ms / 1000, this.zone_index)];
+    var i = findTransition(zone_transitions, this.utc_ms / 1000 - t[1], this.zone_index);
+    t = zone_transitions[i];
+
+    // A wall clock time repeated when the clocks go back has two transitions
+    // which could apply, is_dst picks the one with or without daylight savings.
+    if ( is_dst != undefined && (t[2] != 0) != is_dst ) {
+        var p = zone_transitions[i-1];
+        var n = zone_transitions[i+1];
+        if ( p != undefined && (p[2] != 0) == is_dst && this.utc_ms / 1000 - p[1] < t[0] ) {
+            t = zone_transitions[--i];
+        } else if ( n != undefined && (n[2] != 0) == is_dst && this.utc_ms / 1000 - n[1] >= n[0] ) {
+            t = zone_transitions[++i];
+        }
+    }
+    log.debug("Transition: " + t);
+
+    // Dates before the first transition use it, so it's also the next one.
+    if ( t[0] <= this.utc_ms / 1000 - t[1] ) {
+        i++;
+    }
+    this.next_transition = i < zone_transitions.length ? zone_transitions[i][0] * 1000 : Infinity;
+
+    // The abbreviation was formatted by tz2js.py, transitions hold its index in tz_abbreviations.
+    this.abbreviation = tz_abbreviations[t[3]];
+    this.zone = new Zone({area: res[0], location: res[1], gmt_off: t[1] - t[2], zone_format: this.abbreviation});
+    this.dst_off = t[2] * 1000;
+    this.zone_dst_abbr = "";
 }
 /**********************************************************************/
 tzDate.prototype.DST = function DST() {
@@ -675,7 +1192,7 @@ tzDate.prototype.toString = function toString() {
             (this.walltime.getUTCMonth() + 1)+ "/" +
             this.walltime.getUTCFullYear() + " " +
             (this.zone.getUTCOffset()+this.dst_off)/1000/60/60 + " " +
-            this.zone.getAbbreviation().replace("%s", this.zone_dst_abbr) +
+            this.abbreviation +
             "@"+this.utc_ms;
 }
 /**********************************************************************
@@ -705,22 +1222,55 @@ tzDate.prototype.toString = function toString() {
  *    @year_from:
  *    @time_at:
 */
-tzDate.prototype.parseDstRule = function parseDstRule() {
+tzDate.prototype.parseDstRule = function parseDstRule(is_dst) {
     var rule_name = this.zone.getRule();
     var normalised_rules = {idx:[]};
 
+    // The state before each change of daylight savings, in chronological order.  Standard
+    // time unless a rule says otherwise, zone lines without rules ("-") stay in it.
+    var initial = {utc: -Infinity, save: 0, letters: "", before: 0};
+    this.rule_changes = [initial];
+    this.rules_until = Infinity;
+    if ( rules[rule_name] == undefined ) {
+        // A zone line with a fixed amount of daylight savings ("1:00") rather than a rule set.
+        if ( rule_name != undefined && rule_name.match("^-?[0-9]") ) {
+            var hms = rule_name.replace("-", "").split(":");
+            for ( var i = 0; i < hms.length; i++ ) {
+                initial.save += parseInt(hms[i]) * [3600000, 60000, 1000][i];
+            }
+            if ( rule_name.charAt(0) == "-" ) {
+                initial.save = -initial.save;
+            }
+        }
+        this.applyRuleChange(is_dst);
+        return;
+    }
+
     // Pass 1: Construct a list of rules which will be sorted to  ascending chronological order!
+    if ( isString(rules[rule_name]) ) {
+        rules[rule_name] = unpackRules(rules[rule_name]);
+    }
+
+    // Before any of the rules take effect, the letters of the earliest standard time rule are used.
+    var first_standard = undefined;
+    var window_from = this.localtime.getFullYear()-2;
     for ( var rule_def in rules[rule_name] ) {
         var r = rules[rule_name][rule_def];
 
         log.info("Ruleset: " + objectAsString(r) );
+        if ( r.save == 0 && (first_standard == undefined || r.year_from < first_standard.year_from ||
+                             (r.year_from == first_standard.year_from && r.month_in < first_standard.month_in)) ) {
+            first_standard = r;
+        }
 
-        for ( var year = r.year_from; year <= r.year_to; year++ ) {
-
-            // Skip dates outside a ±2 year range.
-            if (year < this.localtime.getFullYear()-2 || year > this.localtime.getFullYear()+2) {
-                continue;
-            }
+        // Only the years within ±2 of the date matter, and the rule's last year
+        // before them as it may still be in effect at the start of the window.
+        var years = r.year_from < window_from ? [Math.min(r.year_to, window_from - 1)] : [];
+        for ( var year = Math.max(r.year_from, window_from); year <= Math.min(r.year_to, window_from + 4); year++ ) {
+            years.push(year);
+        }
+        for ( var y = 0; y < years.length; y++ ) {
+            var year = years[y];
 
             // Retruns a UTC time for the rule's transition (ignores tz and dst offset).
             var naive_utc = this.getRuleAsNaiveUTC(year, r);
@@ -731,45 +1281,100 @@ tzDate.prototype.parseDstRule = function parseDstRule() {
             normalised_rules[naive_utc.getTime()] = {offset: r.save*1000, letter: r.letters, fmt: r.time_at[1]};
         }
     }
+    if ( first_standard != undefined ) {
+        initial.letters = first_standard.letters;
+    }
+    this.rules_until = Date.UTC(window_from + 5, 0, 1) - this.zone.getUTCOffset();
 
-    // sort into chronological order.
-    normalised_rules.idx.sort();
+    // sort into chronological order, as numbers: the timestamps before 1970 are negative.
+    normalised_rules.idx.sort(function (a, b) { return a - b; });
 
-    // Pass 2: Calculate the dayight savings offsets based on the datetime encoding.
-    for (var i in normalised_rules.idx) {
+    // Pass 2: Convert the rules to UTC instants.  Standard times are on the zone's
+    // offset, wall clock times also on the daylight savings of the rule before them.
+    var gmt_off = this.zone.getUTCOffset();
+    var save = 0;
+    for ( var i = 0; i < normalised_rules.idx.length; i++ ) {
         var r_timestamp = normalised_rules.idx[i];
-        var offset = 0;
+        var instant = r_timestamp;
         switch ( normalised_rules[r_timestamp].fmt ) {
             case "u":
             case "g":
             case "z":
                 // rule in utc, no offset required.
-                offset = 0;
                 break;
             case "s":
-                // Standard time : utc - tz
-                offset = this.zone.getUTCOffset();
+                instant -= gmt_off;
                 break;
-            case "w":
-                // Wall time: utc - tz - dst
-                // In the event there are no previous daylight savings
-                // transitions "standard time" is assumed.
-                // fall through to default, it's wall time.
             default:
-                if ( i > 0 ) {
-                    offset = this.zone.getUTCOffset() + normalised_rules[normalised_rules.idx[i-1]].offset;
-                } else {
-                    offset = this.zone.getUTCOffset()
-                }
+                // Wall time, standard time before the first rule.
+                instant -= gmt_off + save;
         }
-        // Store the dst timestamp with it's offset applied.
-        normalised_rules[r_timestamp].datetime = new Date(r_timestamp + offset);
-        var tmp = new Date(this.localtime.getTime() + this.zone.getUTCOffset());
-        if ( tmp > normalised_rules[r_timestamp].datetime ) {
-            this.dst_off = normalised_rules[r_timestamp].offset;
-            this.zone_dst_abbr = normalised_rules[r_timestamp].letter;
+        this.rule_changes.push({utc: instant, save: normalised_rules[r_timestamp].offset,
+                                letters: normalised_rules[r_timestamp].letter, before: save});
+        save = normalised_rules[r_timestamp].offset;
+    }
+    this.applyRuleChange(is_dst);
+}
+/**********************************************************************
+ * applyRuleChange
+ * ===============
+ * Set the daylight savings, letters and next transition from the rule
+ * change in effect at the wall clock date/time.  A change applies from its
+ * UTC instant on the clock before it, so the verdict and the next transition
+ * both come from the same UTC instants.
+ *
+ * @is_dst: picks the side of the repeated hour when the clocks go back.
+*/
+tzDate.prototype.applyRuleChange = function applyRuleChange(is_dst) {
+    var changes = this.rule_changes;
+    var wall = this.utc_ms - this.zone.getUTCOffset();
+    var k = 0;
+    while ( k + 1 < changes.length && wall >= changes[k+1].utc + changes[k+1].before ) {
+        k++;
+    }
+    if ( is_dst != undefined && (changes[k].save != 0) != is_dst ) {
+        if ( k > 0 && (changes[k].before != 0) == is_dst && wall - changes[k].before < changes[k].utc ) {
+            k--;
+        } else if ( k + 1 < changes.length && (changes[k+1].save != 0) == is_dst && wall - changes[k+1].save >= changes[k+1].utc ) {
+            k++;
         }
     }
+    this.dst_off = changes[k].save;
+    this.zone_dst_abbr = changes[k].letters;
+    // Past the years of the rules looked at, a change may still come.
+    this.next_transition = Math.min(this.getZoneLineEnd(), k + 1 < changes.length ? changes[k+1].utc : this.rules_until);
+}
+/**********************************************************************
+ * getSaveAt
+ * =========
+ * The daylight savings offset, in milliseconds, the rules give at a UTC
+ * instant near the date/time.
+*/
+tzDate.prototype.getSaveAt = function getSaveAt(utc_ms) {
+    var k = 0;
+    while ( k + 1 < this.rule_changes.length && this.rule_changes[k+1].utc <= utc_ms ) {
+        k++;
+    }
+    return this.rule_changes[k].save;
+}
+/**********************************************************************
+ * getZoneLineEnd
+ * ==============
+ * The UTC instant, in milliseconds, at which the zone line in effect ends.
+*/
+tzDate.prototype.getZoneLineEnd = function getZoneLineEnd() {
+    var u = this.zone.zone_data["until"];
+    if ( u == undefined || this.last_zone_line ) {
+        return Infinity;
+    }
+    // The until is on the clock just before it, a rule change at the same time hasn't applied yet.
+    var wall = Date.UTC(u[0], u[1] - 1, u[2], u[3], u[4], u[5]) - this.zone.getUTCOffset();
+    var changes = this.rule_changes;
+    var k = 0;
+    while ( k + 1 < changes.length && wall > changes[k+1].utc + changes[k+1].before ) {
+        k++;
+    }
+    return wall - changes[k].save;
 }
 /**********************************************************************
  * getRuleAsNaiveUTC
@@ -782,17 +1387,14 @@ tzDate.prototype.getRuleAsNaiveUTC = function getRuleAsNaiveUTC(year, r) {
     var [day, cmp, dom] = r["day_on"];
     var mon = r["month_in"];
 
-    if ( isString(day) ) {
-        day = days[day.toLowerCase()];
-    }
-    if ( isString(dom) ) {
-        if ( dom.match("^last") ) {
-            dom = months[ mon - 1]["maxdays"];
-            if ( mon == 2 ) {
-                dom += isLeap(year);
-            }
-        }
+    // The generator resolves the day of the month for each year, fall back to
+    // working it out for rule sets without them (fixed days, open ended rules).
+    if ( r["days"] ) {
+        dom = r["days"][year - r["year_from"]];
+    } else {
+        dom = resolveDayOn(year, mon, day, cmp, dom);
     }
+
     var def_time = [0,0,0];
 
     var time_at = r["time_at"][0].split(":");
@@ -801,28 +1403,25 @@ tzDate.prototype.getRuleAsNaiveUTC = function getRuleAsNaiveUTC(year, r) {
     }
     var [h,m,s] = def_time;
 
-    // Reminder: months in javascript at 0-11
+    // Reminder: months in javascript at 0-11, days past the end of the month carry over.
     var utc = new Date(Date.UTC(year, mon-1, dom, h, m ,s));
 
-    switch (cmp) {
-        case ">=":
-            while (day != utc.getUTCDay() ) {
-                utc.setDate(utc.getUTCDate() + 1);
-            }
-            break;
-        case "<=":
-            while (day != utc.getUTCDay() ) {
-                utc.setDate(utc.getUTCDate() - 1);
-            }
-            break;
-        default:
-            // An exact day of the month is expected, test it's coherent.
-    }
-
     log.debug("Rule : " + utc.toUTCString() + " @" + utc.getTime() + "[" + [day, cmp, dom] + "]");
     return utc;
 }
 
+tzDate.prototype.getAbbreviation = function getAbbreviation() {
+    return this.abbreviation;
+}
+
+tzDate.prototype.getUTCOffset = function getUTCOffset() {
+    return this.zone.getUTCOffset() + this.dst_off;
+}
+
+tzDate.prototype.getNextTransition = function getNextTransition() {
+    return this.next_transition;
+}
+
 tzDate.prototype.timezoneName = function timezoneName() {
     return this.zone.name();
 }
@@ -876,20 +1475,41 @@ Zone.prototype.getAbbreviation = function getAbbreviation() {
 /* CheckPeriods
  * ============
  *
- * Given a list of periods to test,
- */
-function CheckPeriods(periods)
+ * Given a list of periods to test, return the execution policy in effect at
+ * now_ms (default: the current time).  The verdict is cached on the list
+ * until the earliest point any of its periods may change its own.
+*/
+function CheckPeriods(periods, now_ms)
 {
+    var now = now_ms == undefined ? Date.now() : now_ms;
+    var cache = periods.check_cache;
+    if ( cache != undefined && cache.length == periods.length && cache.policy == default_execution_policy &&
+         cache.checked_at <= now && now < cache.valid_until ) {
+        return cache.execution;
+    }
+
     var execution = default_execution_policy;
-    for ( var period in periods ) {
-        if (periods[period].inProgress()){
+    var valid_until = Infinity;
+    for ( var period = 0; period < periods.length; period++ ) {
+        if (periods[period].inProgress(now)){
             log.debug("Time inside period matched! Do we execute the script? " + periods[period].getExecutionPeriod() );
             execution = periods[period].getExecutionPeriod();
         }
+        valid_until = Math.min(valid_until, periods[period].valid_until);
     }
+    periods.check_cache = {execution: execution, policy: default_execution_policy, length: periods.length,
+                           checked_at: now, valid_until: valid_until};
     return execution;
 }
 
+// Bring the data up to date with the patches loaded after it.
+if ( typeof tz_patches != "undefined" ) {
+    for ( var patch = 0; patch < tz_patches.length; patch++ ) {
+        applyPatch(tz_patches[patch]);
+    }
+    tz_patches = [];
+}
+
 var default_execution_policy = true;      // Set the default execution policy in the event no Periods match or are defined.
 
 var periods = [];
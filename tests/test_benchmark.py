@@ -0,0 +1,74 @@
+"""
+Smoke tests of benchmark.py's synth, parse and lookup commands on a small
+synthetic tz database and the pinned tzdata subset in tests/data/tzdata.
+"""
+import os, sys, shutil, filecmp, tempfile, unittest, subprocess
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+TZDATA = os.path.join(TESTS_DIR, "data", "tzdata")
+
+sys.path.insert(0, ROOT_DIR)
+import tz2js, benchmark
+
+SYNTH_OPTIONS = ["--seed", "7", "--zones", "60", "--rule-sets", "12", "--rules-per-set", "10"]
+
+
+def hasZic():
+    try:
+        return subprocess.call(["zic", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE) == 0
+    except OSError:
+        return False
+
+
+class BenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.synthetic = os.path.join(self.tmp_dir, "synthetic")
+        self.runBenchmark("synth", self.synthetic, *SYNTH_OPTIONS)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def runBenchmark(self, *args, **kwargs):
+        """
+        Run a benchmark.py command and return its output, a non zero exit fails the test.
+        """
+        output = subprocess.check_output([sys.executable, os.path.join(ROOT_DIR, "benchmark.py")] + list(args), **kwargs)
+        return output.decode("utf-8")
+
+
+    def testSynthDeterministic(self):
+        other = os.path.join(self.tmp_dir, "other")
+        self.runBenchmark("synth", other, *SYNTH_OPTIONS)
+        filenames = ["zone.tab"] + tz2js.zone_files
+        self.assertEqual(filecmp.cmpfiles(self.synthetic, other, filenames, shallow=False)[0], filenames)
+
+
+    def testParse(self):
+        for tzpath in (TZDATA, self.synthetic):
+            output = self.runBenchmark("parse", tzpath, "--repeat", "1")
+            for name, options in benchmark.output_formats:
+                self.assertIn(name, output)
+            self.assertIn("parseTzData", output)
+
+
+    def testLookup(self):
+        output = self.runBenchmark("lookup", self.synthetic, "--from-year", "2020", "--to-year", "2022")
+        self.assertIn("66 zones, 0 without data", output)
+
+
+    @unittest.skipUnless(hasZic() and benchmark.zoneinfo is not None, "zic and zoneinfo are required")
+    def testSynthAgainstZic(self):
+        # zic rejects data it can't compile, zoneinfo then reads what it wrote.
+        zoneinfo_dir = os.path.join(self.tmp_dir, "zoneinfo")
+        subprocess.check_call(["zic", "-d", zoneinfo_dir] + tz2js.zone_files, cwd=self.synthetic)
+        env = dict(os.environ, PYTHONTZPATH=zoneinfo_dir)
+        output = self.runBenchmark("lookup", self.synthetic, "--from-year", "1900", "--to-year", "2040", env=env)
+        self.assertIn("66 zones checked against zoneinfo, 0 not in zoneinfo, 0 mismatching offsets", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
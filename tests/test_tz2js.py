@@ -0,0 +1,182 @@
+"""
+Tests for tz2js.py against the pinned tzdata subset in tests/data/tzdata.
+Run with python -m unittest discover tests (or pytest) from the repository
+root, the periods.js round trips need node and are skipped without it.
+"""
+import os, sys, json, bisect, shutil, calendar, tempfile, unittest, subprocess
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+TZDATA = os.path.join(TESTS_DIR, "data", "tzdata")
+
+sys.path.insert(0, ROOT_DIR)
+import tz2js
+
+# Loads the data then periods.js the way a page would and prints [offset, abbreviation]
+# for each [tz, year, month, day, hour, minute] wall clock query read from stdin, and
+# [offset, abbreviation, next transition or null] for each [tz, UTC milliseconds] one.
+LOOKUP_JS = """
+var fs = require("fs"), vm = require("vm");
+global.document = {write: function() {}};
+vm.runInThisContext(fs.readFileSync(process.argv[1], "utf8"));
+vm.runInThisContext(fs.readFileSync(process.argv[2], "utf8"));
+console.log(JSON.stringify(JSON.parse(fs.readFileSync(0, "utf8")).map(function(q) {
+    if ( q.length == 2 ) {
+        var d = tzDateFromUTC(q[1], q[0]);
+        var next = nextTransition(q[0], q[1]);
+        return [d.getUTCOffset() / 1000, d.getAbbreviation(), next == Infinity ? null : next];
+    }
+    var d = new tzDate(q[1], q[2] - 1, q[3], q[4], q[5], 0, 0, q[0]);
+    return [(d.zone.getUTCOffset() + d.dst_off) / 1000, d.getAbbreviation()];
+})));
+"""
+
+FIXTURE_ZONES = ["America/Campo_Grande", "America/Iqaluit", "America/New_York", "Asia/Jerusalem", "Asia/Tehran",
+                 "Europe/Paris", "Pacific/Auckland"]
+
+
+def hasNode():
+    try:
+        return subprocess.call(["node", "--version"], stdout=subprocess.PIPE) == 0
+    except OSError:
+        return False
+
+
+class PackedRulesTest(unittest.TestCase):
+    def setUp(self):
+        zones, self.rules, links = tz2js.loadTzData(TZDATA, (tz2js.MIN_YEAR, tz2js.DEFAULT_TO_YEAR))
+
+
+    def testDaysOneCharPerYear(self):
+        encoder = tz2js.PackedEncoder()
+        for name, rule_set in self.rules.items():
+            values = encoder.packRules(rule_set).split(",")
+            for number, rule in enumerate(rule_set):
+                days = values[number * 13 + 12]
+                if days:
+                    days = encoder.strings[int(days[1:], 36)]
+                    self.assertEqual(len(days), rule.getYearTo() - rule.getYearFrom() + 1)
+                    self.assertEqual([int(day, 36) for day in days], rule.getDays())
+
+
+    def testDaysInPreviousMonthNotPacked(self):
+        # Zion 2005-2012 Apr Fri<=1 falls on Mar 31 or earlier in most years.
+        encoder = tz2js.PackedEncoder()
+        rule_set = self.rules["Z"]
+        number = [(rule.getYearFrom(), rule.getYearTo()) for rule in rule_set].index((2005, 2012))
+        self.assertEqual(rule_set[number].getDays(), [1, 0, -1, -3, -4, -5, 1, -1])
+        self.assertEqual(encoder.packRules(rule_set).split(",")[number * 13 + 12], "")
+
+
+class RuleExpanderTest(unittest.TestCase):
+    def testMemoizedWithinWindow(self):
+        zones, rules, links = tz2js.loadTzData(TZDATA, (tz2js.MIN_YEAR, tz2js.DEFAULT_TO_YEAR))
+        expander = tz2js.RuleExpander(rules)
+        expander.prefill(2000, 2010)
+        expander.expand("Z", 2001, 2003)
+        for year_from, year_to in ((1940, 1950), (1999, 2001), (2040, 2042)):
+            self.assertEqual(expander.expand("Z", year_from, year_to), tz2js.RuleExpander(rules).expand("Z", year_from, year_to))
+        self.assertEqual(list(expander.ranges), [("Z", 2001, 2003)])
+        self.assertEqual([key for key in expander.years if not 2000 <= key[1] <= 2010], [])
+
+
+class TzDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.db = tz2js.TzDatabase(TZDATA, 2013, 2020)
+        self.start = calendar.timegm((2013, 1, 1, 0, 0, 0))
+
+
+    def testBeforeCompiledYears(self):
+        self.assertEqual(self.db.abbreviation("Europe/Paris", self.start), "CET")
+        self.assertEqual(self.db.nextTransition("Europe/Paris", self.start), 1364691600)
+        for method in (self.db.lookup, self.db.utcoffset, self.db.nextTransition):
+            self.assertRaises(ValueError, method, "Europe/Paris", self.start - 1)
+
+
+    @unittest.skipUnless(tz2js.numpy is not None, "numpy is required for batch lookups")
+    def testArrayBeforeCompiledYears(self):
+        timestamps = tz2js.numpy.array([self.start, 1372680000])
+        self.assertEqual(list(self.db.lookupArray("Europe/Paris", timestamps)[0]), [3600, 7200])
+        self.assertRaises(ValueError, self.db.lookupArray, "Europe/Paris", timestamps - 1)
+        self.assertRaises(ValueError, self.db.lookupArray, tz2js.numpy.array(["Pacific/Auckland", "Europe/Paris"]), timestamps - 1)
+
+
+class TzServiceTest(unittest.TestCase):
+    def testServedYearsOutsideWindow(self):
+        # Only the LRU grows with the years served outside the database's window.
+        service = tz2js.TzService(TZDATA, lru_size=4)
+        db, cache = service.current
+        expander = db.expander
+        sizes = [len(expander.years), len(expander.ranges), len(expander.arrays)]
+        queries = [[zone, calendar.timegm((year, 6, 1, 0, 0, 0))]
+                   for year in range(1000, 9990, 90) for zone in ("Europe/Paris", "Pacific/Auckland")]
+        results = service.query(queries)
+        self.assertEqual([result for result in results if isinstance(result, dict)], [])
+        self.assertEqual([len(expander.years), len(expander.ranges), len(expander.arrays)], sizes)
+        self.assertEqual(len(cache.entries), 4)
+        self.assertEqual(service.query([["Europe/Paris", 1372680000]]), [[7200, 3600, "CEST"]])
+
+
+@unittest.skipUnless(hasNode(), "node is required to run periods.js")
+class PeriodsRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def lookup(self, queries, *options):
+        data = os.path.join(self.tmp_dir, "data.js")
+        subprocess.check_call([sys.executable, os.path.join(ROOT_DIR, "tz2js.py"), TZDATA, "-o", data] + list(options),
+            stderr=subprocess.PIPE)
+        node = subprocess.Popen(["node", "-e", LOOKUP_JS, data, os.path.join(ROOT_DIR, "periods.js")],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        output = node.communicate(json.dumps(queries).encode("utf-8"))[0]
+        self.assertEqual(node.returncode, 0)
+        return json.loads(output.decode("utf-8"))
+
+
+    def testJerusalemPacked(self):
+        # Israel was on summer time by Apr 2 every year Zion 2005-2012 applies.
+        queries = [["Asia/Jerusalem", year, 4, 2, 12, 0] for year in range(2005, 2013)]
+        queries += [["Asia/Jerusalem", year, month, 15, 12, 0] for year in range(2000, 2016) for month in (3, 4, 9, 10)]
+        expected = self.lookup(queries, "--full-history")
+        self.assertEqual([result[0] for result in expected[:8]], [10800] * 8)
+        self.assertEqual(self.lookup(queries, "--full-history", "--format", "packed"), expected)
+
+
+    def testFullHistoryRules(self):
+        # periods.js applies the rules itself to data which isn't compiled.  Every
+        # 53 days from 1900, away from the transitions TzDatabase compiled.
+        db = tz2js.TzDatabase(TZDATA, 1900, 2040)
+        queries, expected = [], []
+        for zone in FIXTURE_ZONES:
+            instants = db.getTransitions(zone)[0]
+            for timestamp in range(-2208988800, 2208988800, 53 * 86400 + 3607):
+                index = bisect.bisect(instants, timestamp)
+                if min(abs(timestamp - instant) for instant in instants[max(index - 1, 0):index + 1]) > 2 * 86400:
+                    queries.append([zone, timestamp * 1000])
+                    expected.append([db.utcoffset(zone, timestamp), db.abbreviation(zone, timestamp)])
+        results = [result[:2] for result in self.lookup(queries, "--full-history")]
+        self.assertEqual([(query, result, value) for query, result, value in zip(queries, results, expected) if result != value], [])
+
+
+    def testRulesNextTransition(self):
+        # Around each rule transition the state and the next transition periods.js works
+        # out from the rules agree.  The next transition may come early, never late.
+        db = tz2js.TzDatabase(TZDATA, 1990, 2040)
+        queries, expected = [], []
+        for zone in ("America/New_York", "Asia/Jerusalem", "Europe/Paris", "Pacific/Auckland"):
+            for transition in db.transitions(zone, 631152000, 2208988800):
+                for timestamp in (transition[0] + delta for delta in (-3601, -1, 0, 1, 1800, 3599, 3600, 5400)):
+                    queries.append([zone, timestamp * 1000])
+                    expected.append([db.utcoffset(zone, timestamp), db.abbreviation(zone, timestamp), db.nextTransition(zone, timestamp)])
+        results = self.lookup(queries, "--full-history")
+        self.assertEqual([(query, result, value) for query, result, value in zip(queries, results, expected)
+                          if result[:2] != value[:2] or not query[1] < result[2] <= value[2] * 1000], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
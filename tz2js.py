@@ -24,27 +24,62 @@
 
 
 # Required modules
-import os, sys, re, json, time, datetime, logging
+from __future__ import print_function
+import os, sys, re, io, gzip, json, math, time, bisect, numbers, datetime, calendar, fnmatch, hashlib, logging, argparse, tarfile, threading, subprocess, collections, multiprocessing
 
-logging.basicConfig( )#level=logging.DEBUG ) # Numeric logging level for the message (DEBUG, INFO, WARNING, ERROR, CRITICAL).
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
 
-def usage():
-    print "\nUsage: %s <path to tzdata directory>\n" % sys.argv[0]
-    sys.exit(1)
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
-if len(sys.argv) != 2:
-    usage()
-
-tzpath = os.path.join(sys.argv[1])
-
-if not os.path.exists(tzpath):
-    logging.critical( "File '%s' doesn't exist" % tzpath )
-    sys.exit(2)
+# Optional, only the batch lookups of TzDatabase need it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 months = [ "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec" ]
 days = [ "Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun" ]
 
-MAX_YEAR = 2050
+# Year standing in for the open ended TO "max" and empty UNTIL fields, the output window clamps it.
+MAX_YEAR = 9999
+# Last year of the output window unless --to-year says otherwise.
+DEFAULT_TO_YEAR = 2050
+# First year of the output window with --full-history, before any zone's UNTIL.
+MIN_YEAR = 1800
+# Seconds covered by each entry of the --index bucket index, the mean Gregorian month.
+INDEX_STRIDE = 2629746
+# Rule transitions a zone line needs after its start before compileZone applies them with numpy.
+VECTOR_MIN_RULES = 32
+# (zone, year) resolutions --serve keeps unless --lru-size says otherwise, every zone for a few decades.
+DEFAULT_LRU_SIZE = 16384
+# Whether the parser logs its per field debug messages, main sets it from the logging level.
+# Checked first as a logging.debug call costs a lookup of the level even when it's disabled.
+DEBUG = False
+
+# Change whenever the records produced by readRuleZoneFile change, so stale cache files are ignored.
+CACHE_VERSION = 4
+
+# Names, letters and formats repeat across thousands of records, only one copy of each is kept.
+try:
+    internString = sys.intern
+except AttributeError:
+    internString = intern
+
+if sys.version_info[0] >= 3:
+    def nativeString(data):
+        """
+        tz database files are read as bytes, Python 3 parses them as text.
+        """
+        return data.decode("utf-8")
+else:
+    def nativeString(data):
+        return data
 
 zone_files = [
     "africa",
@@ -82,17 +117,280 @@ class DateTime(datetime.datetime):
         return self.isoformat() # present dates in ISO 8601 format
 
 
+def toBase36(number):
+    """
+    Return an integer as a base 36 string, as read by javascript's parseInt(s, 36).
+    """
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    sign = number < 0 and "-" or ""
+    number = abs(number)
+    res = ""
+    while True:
+        number, digit = divmod(number, 36)
+        res = digits[digit] + res
+        if number == 0:
+            return sign + res
+
+
+class AbbreviationTable(object):
+    """
+    Interned table of the abbreviations of compiled transitions.  Each
+    abbreviation is formatted once by compileZone, the transitions written
+    out reference it by its index in the table.
+    """
+    def __init__(self):
+        self.abbreviations = []
+        self.abbreviation_index = {}
+
+
+    def intern(self, abbreviation):
+        if abbreviation not in self.abbreviation_index:
+            self.abbreviation_index[abbreviation] = len(self.abbreviations)
+            self.abbreviations.append(abbreviation)
+        return self.abbreviation_index[abbreviation]
+
+
+    def indexTransitions(self, transitions):
+        """
+        Return transitions with their abbreviation replaced by its index.
+        """
+        return [transition[:3] + [self.intern(transition[3])] for transition in transitions]
+
+
+class PackedEncoder(object):
+    """
+    Packs zones, rules and transitions into strings of comma separated tokens
+    which periods.js decodes the first time a zone or rule set is looked up.
+
+    A token is a base 36 integer, "$" followed by the base 36 index of a
+    string in the shared string table, or empty for null.  Years, offsets and
+    UTC instants are delta encoded against the previous entry.
+
+    Fields per entry:
+      zone line:  area, location, gmt_off, rules, zone_format, until as naive seconds
+      rule:       name, year_from, year_to - year_from, month_in, day_on[0..2],
+                  time_at[0..1], rule_type, save, letters, days as one base 36
+                  digit per year
+      transition: utc, offset, save, abbreviation index
+    """
+    def __init__(self):
+        self.strings = []
+        self.string_index = {}
+
+
+    def intern(self, string):
+        if string not in self.string_index:
+            self.string_index[string] = len(self.strings)
+            self.strings.append(string)
+        return self.string_index[string]
+
+
+    def packValues(self, values):
+        tokens = []
+        for value in values:
+            if value is None:
+                tokens.append("")
+            elif isinstance(value, int):
+                tokens.append(toBase36(value))
+            else:
+                tokens.append("$" + toBase36(self.intern(value)))
+        return ",".join(tokens)
+
+
+    def packZone(self, zone):
+        values = []
+        gmt_off = until = 0
+        for zone_line in zone:
+            values.extend([zone_line.getArea(), zone_line.getLocation(), zone_line.getGMTOffset() - gmt_off,
+                zone_line.getRules(), zone_line.getFormat(), calendar.timegm(zone_line.getYearUntil()) - until])
+            gmt_off, until = zone_line.getGMTOffset(), calendar.timegm(zone_line.getYearUntil())
+        return self.packValues(values)
+
+
+    def packRules(self, rule_set):
+        values = []
+        year = 0
+        for rule in rule_set:
+            values.extend([rule.getName(), rule.getYearFrom() - year, rule.getYearTo() - rule.getYearFrom(), rule.getMonthIn()])
+            values.extend(dayOnAsJSON(rule.getDayOn()))
+            values.extend(rule.getTimeAt())
+            days = rule.getDays()
+            if days and (min(days) < 1 or max(days) > 35):
+                # Days before the 1st of the month or past a single base 36 digit
+                # don't fit one char per year, periods.js resolves the day itself.
+                days = None
+            values.extend([rule.rule_type, rule.getSave(), rule.getLetters(), days and "".join(toBase36(day) for day in days)])
+            year = rule.getYearFrom()
+        return self.packValues(values)
+
+
+    def packTransitions(self, transitions):
+        values = []
+        utc = 0
+        for transition in transitions:
+            values.extend([transition[0] - utc] + transition[1:])
+            utc = transition[0]
+        return self.packValues(values)
+
+
+    def packAll(self, data, pack):
+        """
+        Apply pack to each value of an {area: {location: value}} or {name: value} structure.
+        """
+        packed = {}
+        for key, value in data.items():
+            if isinstance(value, dict):
+                packed[key] = self.packAll(value, pack)
+            else:
+                packed[key] = pack(value)
+        return packed
+
+
+class Profile(object):
+    """
+    Collect the --profile statistics: parse time, line count and the zones,
+    rules and links kept or discarded for each source file, and the bytes
+    written for each zone and rule set.  Nothing is collected without one.
+    """
+    def __init__(self):
+        self.files = []
+        self.file_stats = {}
+        self.output = []
+
+
+    def addFile(self, filename, lines, seconds, cached=False):
+        self.files.append(filename)
+        self.getCounts(filename).update(lines=lines, seconds=seconds, cached=cached)
+
+
+    def getCounts(self, filename):
+        """
+        Return the statistics dict of a source file, the record counts are
+        incremented by mergeRuleZoneRecords.
+        """
+        if filename not in self.file_stats:
+            self.file_stats[filename] = dict(lines=0, seconds=0.0, cached=False,
+                zones_kept=0, zones_discarded=0, rules_kept=0, rules_discarded=0, links=0)
+        return self.file_stats[filename]
+
+
+    def addOutput(self, variable, name, size):
+        self.output.append( (variable, name, size) )
+
+
+    def report(self, out):
+        print("%-12s %7s %8s %9s %14s %14s %6s" % ("file", "lines", "seconds", "lines/s", "zone lines", "rules", "links"), file=out)
+        for filename in self.files:
+            stats = self.file_stats[filename]
+            print("%-12s %7d %8.4f %9d %7d/%-6d %7d/%-6d %6d%s" % (filename, stats["lines"], stats["seconds"],
+                stats["lines"] / max(stats["seconds"], 1e-6), stats["zones_kept"], stats["zones_discarded"],
+                stats["rules_kept"], stats["rules_discarded"], stats["links"], stats["cached"] and " (cached)" or ""), file=out)
+        print("zone lines and rules are kept/discarded", file=out)
+
+        variables = []
+        totals = {}
+        for variable, name, size in self.output:
+            if variable not in totals:
+                variables.append(variable)
+                totals[variable] = [0, 0]
+            totals[variable][0] += 1
+            totals[variable][1] += size
+        for variable in variables:
+            print("\n%s: %d bytes in %d entries" % (variable, totals[variable][1], totals[variable][0]), file=out)
+            for entry_variable, name, size in sorted(self.output, key=lambda entry: -entry[2]):
+                if entry_variable == variable:
+                    print("%8d %s" % (size, name), file=out)
+
+
+class JsWriter(object):
+    """
+    Write the output's javascript variables to a file or stdout one zone or
+    rule set at a time, so the serialised output is never held in memory.
+    A file is written under a temporary name and renamed when closed.
+    """
+    def __init__(self, path=None, compress=False, profile=None):
+        self.path = path
+        self.profile = profile
+        if path:
+            self.tmp_path = "%s.%d.tmp" % (path, os.getpid())
+            self.fh = open(self.tmp_path, "wb")
+        else:
+            self.fh = getattr(sys.stdout, "buffer", sys.stdout)
+        self.out = self.fh
+        if compress:
+            # No file name or timestamp in the header, the same input gives the same bytes.
+            self.out = gzip.GzipFile(filename="", mode="wb", fileobj=self.fh, mtime=0)
+
+
+    def write(self, text):
+        self.out.write(text.encode("utf-8"))
+
+
+    def writeVariable(self, name, data, depth=0, leaf=None):
+        """
+        Write a 'name = <json>' line.  The first depth levels of dicts are
+        written entry by entry, leaf is applied to each value below them.
+        """
+        self.write("%s = " % name)
+        self.writeValue(data, depth, leaf, name, [])
+        self.write("\n")
+
+
+    def writeValue(self, data, depth, leaf, variable, keys):
+        if depth == 0:
+            value = leaf(data) if leaf else data
+            if value and isinstance(value, list) and hasattr(value[0], "toJSONText"):
+                # Zone lines and rules serialise themselves, no intermediate dicts are built.
+                text = "[%s]" % ", ".join(record.toJSONText() for record in value)
+            else:
+                text = json.dumps(value, cls=jsonEncoderHelper)
+            if self.profile and keys:
+                self.profile.addOutput(variable, "/".join(str(key) for key in keys), len(text))
+            self.write(text)
+            return
+        self.write("{")
+        separator = ""
+        for key, value in data.items():
+            # json converts None keys to "null", as json.dumps of the whole dict would.
+            self.write("%s%s: " % (separator, json.dumps(key if isinstance(key, str) else json.dumps(key))))
+            self.writeValue(value, depth-1, leaf, variable, keys + [key])
+            separator = ", "
+        self.write("}")
+
+
+    def writePatch(self, patch):
+        """
+        Write a patch built by buildPatch, queued in tz_patches for
+        periods.js to apply over the data loaded before it.
+        """
+        self.write('tz_patches = typeof tz_patches == "undefined" ? [] : tz_patches\n')
+        self.write("tz_patches.push(")
+        self.writeValue(patch, 1, None, "tz_patches", [])
+        self.write(")\n")
+
+
+    def close(self):
+        if self.out is not self.fh:
+            self.out.close()
+        if self.path:
+            self.fh.close()
+            os.rename(self.tmp_path, self.path)
+        else:
+            self.fh.flush()
+
+
 class TimeZoneBase(object):
+    __slots__ = ()
+
     def __init__(self):
         raise NotImplemented
 
-    def _TimeToSeconds(self, _time):
+    @staticmethod
+    def _TimeToSeconds(_time):
         """
         Expected form for _time is "-1:33:40".
         Returns an integer representing the total number of seconds.
         """
-        logging.debug("Convert to seconds %s" % _time)
-
         offset_time = 0                 # The default value for the offset is 0:0:0 GMT
         time_factor = [3600,60,1]       # The factors to apply to each value h:m:s to calculate seconds.
         signed = 1                      # signed controls the factorisation of the time as positive or negitive
@@ -103,25 +401,64 @@ class TimeZoneBase(object):
             signed = -1
             _time = tmp[1]
 
-        logging.debug("Post sign treatment %s is a %s %s" % (_time, type(_time), signed) )
-
         # Calculate time in seconds.
         for x, v in enumerate(_time.split(":")):
             offset_time += int(v) * time_factor[x]
 
-        logging.debug("Post time treatment %s is a %s and %s is a %s" % (offset_time, type(offset_time), signed, type(signed)) )
-
         # Apply sign to conversion
         res = offset_time * signed      # BUGFIX: negative numbers weren't managed correctly.
-        logging.debug("\t == %s" % res )
+        if DEBUG:
+            logging.debug("Convert to seconds %s == %s", _time, res)
         return res
 
 
+def parseDayOn(day_on):
+    """
+    Given a day as either a specific day of the month e.g. 1st or 24th etc.
+    Or a day of the week, a comparison operator and a day of the month
+    Return a tuple (day of the week, comparrison operator, day of the month).
+
+    The day of the week is its index in days (Mon is 0), the day of the
+    month an integer or "last".
+    """
+
+    # Temporary variables to be used in the return tuple.
+    day = comp = dom = None
+
+    if day_on.isdigit():
+        dom = int(day_on)
+    elif day_on.startswith("last"):
+        day = day_on[4:]
+        comp = "<="
+        dom = "last"
+    else:
+        for comp in (">=", "<="):
+            if day_on.find(comp) != -1:
+                day, dom = day_on.split(comp, 1)
+                dom = int(dom)
+                break
+        else:
+            comp = None
+    if day is not None:
+        day = days.index(day[:3])
+    return (day, comp, dom)
+
+
+def dayOnAsJSON(day_on):
+    """
+    Return a parsed ON field with the day of the week named, as periods.js expects.
+    """
+    day, comp, dom = day_on
+    return [day is not None and days[day] or None, comp, dom]
+
+
 class TimeZoneRule(TimeZoneBase):
     """
     Holds a timezone rule.  The expected format is a list which contains
     the [Rule, NAME, FROM, TO, TYPE, IN, ON, AT, SAVE, LETTER/S]
     """
+    __slots__ = ("name", "year_from", "year_to", "month_in", "day_on", "time_at", "rule_type", "save", "letters")
+
     def __init__(self, name, year_from, year_to, rule_type, month_in, day_on, time_at, save, letters):
         self.setName(name)
         self.setYearFrom(year_from)
@@ -135,26 +472,36 @@ class TimeZoneRule(TimeZoneBase):
 
 
     def setName(self, name):
-        self.name = name
+        self.name = internString(name)
 
 
     def getName(self):
         return self.name
 
 
-    def isCurrent(self):
+    def isInWindow(self, year_from, year_to):
         """
-        Test if the current date/time falls within the min/max period.
+        Test if the rule applies to any year of the year_from/year_to window.
         """
-        # Accept rules one year before the current year.  This allows for rules that straddle
+        # Accept rules one year before the window.  This allows for rules that straddle
         # start/end of year boundary.
-        if (self.year_from <= time.gmtime()[0]-1 <= self.year_to) or (self.year_from > time.gmtime()[0]-1):
-            logging.debug( "%s: Period included." % self.__class__.__name__ )
+        if self.year_to >= year_from-1 and self.year_from <= year_to:
+            if DEBUG:
+                logging.debug( "%s: Period included.", self.__class__.__name__ )
             return True
-        logging.debug( "%s: Period excluded %s -> %s" % ( self.__class__.__name__, self.year_from, self.year_to ) )
+        if DEBUG:
+            logging.debug( "%s: Period excluded %s -> %s", self.__class__.__name__, self.year_from, self.year_to )
         return False
 
 
+    def clampToWindow(self, year_from, year_to):
+        """
+        Cut the rule's years down to the window, keeping the year before it.
+        """
+        self.year_from = max(self.year_from, year_from-1)
+        self.year_to = min(self.year_to, year_to)
+
+
     def setYearFrom(self, year_from):
         """
         Expected input: YYYY formatted year.
@@ -163,8 +510,8 @@ class TimeZoneRule(TimeZoneBase):
         if year_from.isdigit():
             self.year_from = int(year_from)
         else:
-            logging.error( "%s: Unhandled format in Year From argument." % self.__class__.__name__ )
-            raise "Year From isn't a digit!"
+            logging.error( "%s: Unhandled format in Year From argument.", self.__class__.__name__ )
+            raise ValueError("Year From isn't a digit!")
 
 
     def getYearFrom(self):
@@ -176,7 +523,8 @@ class TimeZoneRule(TimeZoneBase):
             self.year_to = self.year_from
         elif year_to == "max":              # Transform TO "max" arbitrarily selected maximum year.
             self.year_to = MAX_YEAR
-            logging.info( "%s: Set 'max' to %d" % ( self.__class__.__name__, MAX_YEAR ) )
+            if DEBUG:
+                logging.debug( "%s: Set 'max' to %d", self.__class__.__name__, MAX_YEAR )
         else:
             self.year_to = int(year_to)     # expect year to be a number, so it's explicitly cast to an integer
 
@@ -206,30 +554,29 @@ class TimeZoneRule(TimeZoneBase):
 
     def setDayOn(self, day_on):
         """
-        Given a day as either a specific day of the month e.g. 1st or 24th etc.
-        Or a day of the week, a comparison operator and a day of the month
-        Return an away [day of the week, comparrison operator, day of the month].
+        Store the ON field as (day of the week, comparrison operator, day of the month).
+        See parseDayOn.
         """
+        self.day_on = parseDayOn(day_on)
+        if DEBUG:
+            logging.debug("%s: Day On: %s", self.__class__.__name__, self.day_on)
 
-        # Temporary variables to be used in the return array.
-        day = comp = dom = None
 
-        if day_on.isdigit():
-            dom = int(day_on)
-        else:
-            try:
-                day, comp, dom = re.search('(\w+)(\W+)(\d+)',day_on).groups()
-            except(AttributeError):
-                pass
-            try:
-                day = re.search('last(\w+)', day_on).groups()[0]
-                comp = "<="
-                dom = "last"
-            except(AttributeError):
-                pass
-        # confirm the format is valid then calculate the day of the month.
-        logging.debug("%s: Day On: %s, %s, %s" % (self.__class__.__name__, day, comp, dom) )
-        self.day_on = [day, comp, dom]
+    def getDayOn(self):
+        return self.day_on
+
+
+    def getDays(self):
+        """
+        Return the day of the month the rule falls on in each year from
+        year_from to year_to, resolved so periods.js needn't search for the
+        weekday.  None when ON is a fixed day of the month or the rule is
+        open ended.  Days past the end of the month (Sun>=29) carry over
+        into the next month, days of 0 or less (Fri<=1) fall in the previous.
+        """
+        if self.day_on[0] is None or self.year_to >= MAX_YEAR:
+            return None
+        return [dayOfMonth(year, self.month_in, self.day_on) for year in range(self.year_from, self.year_to + 1)]
 
 
     def setTimeAt(self, time_at):
@@ -244,8 +591,9 @@ class TimeZoneRule(TimeZoneBase):
             special_char = time_at[-1:]
             time_at = time_at[:-1]
 
-        logging.debug("%s: Time At: %s, %s"% (self.__class__.__name__, time_at, special_char) )
-        self.time_at = [time_at, special_char]
+        if DEBUG:
+            logging.debug("%s: Time At: %s, %s", self.__class__.__name__, time_at, special_char)
+        self.time_at = (internString(time_at), special_char)
 
 
     def getTimeAt(self):
@@ -256,7 +604,7 @@ class TimeZoneRule(TimeZoneBase):
         """
         @arg letters holds the letter to identify the day light savings.
         """
-        self.letters = letters.strip()
+        self.letters = internString(letters.strip())
         if self.letters == "-":
             self.letters = ""
 
@@ -268,6 +616,8 @@ class TimeZoneRule(TimeZoneBase):
     def setRuleType(self, rule_type):
         if rule_type == "-":
             rule_type = None
+        else:
+            rule_type = internString(rule_type)
         self.rule_type = rule_type
 
 
@@ -295,14 +645,32 @@ class TimeZoneRule(TimeZoneBase):
             "year_from": self.year_from,
             "year_to": self.year_to,
             "month_in": self.month_in,
-            "day_on": self.day_on,
+            "day_on": dayOnAsJSON(self.day_on),
             "time_at": self.time_at,
             "rule_type": self.rule_type,
             "save": self.save,
-            "letters": self.letters
+            "letters": self.letters,
+            "days": self.getDays()
         }
 
 
+    def toJSONText(self):
+        """
+        Serialise the rule straight to the JSON object toJSON describes.
+        """
+        return '{"name": %s, "year_from": %d, "year_to": %d, "month_in": %d, "day_on": %s, "time_at": %s, "rule_type": %s, "save": %d, "letters": %s, "days": %s}' % (
+            json.dumps(self.name),
+            self.year_from,
+            self.year_to,
+            self.month_in,
+            json.dumps(dayOnAsJSON(self.day_on)),
+            json.dumps(self.time_at),
+            json.dumps(self.rule_type),
+            self.save,
+            json.dumps(self.letters),
+            json.dumps(self.getDays()))
+
+
 
 
 class TimeZone(TimeZoneBase):
@@ -310,6 +678,8 @@ class TimeZone(TimeZoneBase):
     [Zone, NAME, GMTOFF, RULES, FORMAT, [UNTIL]] or
     [GMTOFF, RULES, FORMAT, [UNTIL]]
     """
+    __slots__ = ("area", "location", "gmt_off", "rules", "zone_format", "until", "until_type")
+
     def __init__(self, name, gmt_off, rules, zone_format, until = MAX_YEAR):
         self.setName(name)
         self.setGMTOffset(gmt_off)
@@ -326,14 +696,16 @@ class TimeZone(TimeZoneBase):
         """
 
         if name.find("/") == -1:
-            logging.debug("No slash in location '%s'"%name)
-            self.area = name.lower()
+            if DEBUG:
+                logging.debug("No slash in location '%s'", name)
+            self.area = internString(name.lower())
             self.location = None
         else:
-            logging.debug("Split on first slash for %s"%name)
+            if DEBUG:
+                logging.debug("Split on first slash for %s", name)
             self.area, self.location = name.split("/", 1)
-            self.area = self.area.lower()
-            self.location = self.location.lower()
+            self.area = internString(self.area.lower())
+            self.location = internString(self.location.lower())
 
 
     def getName(self):
@@ -360,7 +732,7 @@ class TimeZone(TimeZoneBase):
 
 
     def setRules(self, rules):
-        self.rules = rules
+        self.rules = internString(rules)
 
 
     def getRules(self):
@@ -368,7 +740,7 @@ class TimeZone(TimeZoneBase):
 
 
     def setFormat(self, zone_format):
-        self.zone_format = zone_format
+        self.zone_format = internString(zone_format)
 
 
     def getFormat(self):
@@ -378,39 +750,48 @@ class TimeZone(TimeZoneBase):
     def setYearUntil(self, until):
         """
         Examples "1916 May 14 23:00" or "1911" and anything in between.
+        Stored as [YYYY, MM, DD, HH, MM, SS] with the day of the month and
+        time of day resolved, e.g. "1916 Oct Sun>=1 2:00s" becomes
+        [1916, 10, 1, 2, 0, 0], and the time's w/s/u suffix as until_type.
+        An empty UNTIL is MAX_YEAR.
         """
-        default = [MAX_YEAR, 1, 1, 0, 0, 0]
-        tmp = until.split(" ")
-        if len(tmp[0]) == 0:
-            # Empty until field, set the date to max.
-            tmp = default
-            logging.debug("*** %s: Year Until = %s" % (self.__class__.__name__, str(tmp) ) )
+        tmp = until.split()
+        if not tmp:
+            tmp = [str(MAX_YEAR)]
+            if DEBUG:
+                logging.debug("*** %s: Year Until = %s", self.__class__.__name__, tmp)
 
-        if "" in tmp:
-            logging.debug( "Fixed %s", str(tmp) )
-            tmp.remove('')
+        year = int(tmp[0])
+        month = len(tmp) > 1 and months.index(tmp[1][:3])+1 or 1
+        day = dayOfMonth(year, month, parseDayOn(tmp[2])) if len(tmp) > 2 else 1
+        at, self.until_type = splitTimeSuffix(len(tmp) > 3 and tmp[3] or "0")
 
-        # TODO: Implement parsing for the year_until
-        if len(tmp) >= 2 and type(tmp[1]) == type(""):
-            tmp[1] = months.index(tmp[1])+1
-
-        for x, i in enumerate(tmp):
-            try:
-                default[x] = int(tmp[x])
-            except ValueError:
-                default[x] = tmp[x]
-        self.until = default
+        # Normalise days and times which overflow, e.g. Sun>=29 or 24:00.
+        self.until = tuple(time.gmtime(calendar.timegm((year, month, day, 0, 0, 0)) + at)[:6])
 
 
-    def isCurrent(self):
+    def isInWindow(self, year_from, year_to):
         # For the sake of simplicity, only the year is tested.
-        return self.until[0] >= time.gmtime()[0]
+        return self.until[0] >= year_from
+
+
+    def clampToWindow(self, year_from, year_to):
+        """
+        Zone lines open beyond the window end with it.
+        """
+        if self.until[0] > year_to:
+            self.until = (year_to+1, 1, 1, 0, 0, 0)
+            self.until_type = "w"
 
 
     def getYearUntil(self):
         return self.until
 
 
+    def getUntilType(self):
+        return self.until_type
+
+
     def __str__(self):
         return "Zone Area: %s Location %s, GMT Offset: %s, Rule: %s, Format: %s, Until: %s" % (
             self.area,
@@ -432,8 +813,139 @@ class TimeZone(TimeZoneBase):
         }
 
 
+    def toJSONText(self):
+        """
+        Serialise the zone line straight to the JSON object toJSON describes.
+        """
+        return '{"area": %s, "location": %s, "gmt_off": %d, "rules": %s, "zone_format": %s, "until": %s}' % (
+            json.dumps(self.area),
+            json.dumps(self.location),
+            self.gmt_off,
+            json.dumps(self.rules),
+            json.dumps(self.zone_format),
+            json.dumps(self.until))
+
+
+
+def openTzArchive(path):
+    """
+    Open a tzdata release tarball for reading without extracting it.  gzip,
+    bzip2 and uncompressed tarballs are read directly, lzip tarballs are
+    decompressed in memory with the lzip command.
+    """
+    if path.endswith(".lz"):
+        try:
+            lzip = subprocess.Popen(["lzip", "-dc", path], stdout=subprocess.PIPE)
+        except OSError:
+            raise IOError("The lzip command is required to read '%s'" % path)
+        data = lzip.communicate()[0]
+        if lzip.returncode != 0:
+            raise IOError("Unable to decompress '%s'" % path)
+        archive = tarfile.open(fileobj=io.BytesIO(data))
+    else:
+        archive = tarfile.open(path, "r:*")
+
+    # Index members by file name, tarballs repackaged with a top level directory are accepted too.
+    members = {}
+    for member in archive.getmembers():
+        if member.isfile():
+            members[os.path.basename(member.name)] = member
+    return archive, members
+
+
+class TzSource(object):
+    """
+    The files of a tz database, either in a tzdata directory or streamed
+    straight out of a release tarball.
+    """
+    def __init__(self, tzpath):
+        if not os.path.exists(tzpath):
+            raise IOError("File '%s' doesn't exist" % tzpath)
+        self.tzpath = tzpath
+        self.archive = None
+        if os.path.isfile(tzpath):
+            self.archive, self.members = openTzArchive(tzpath)
+
+
+    def open(self, filename):
+        """
+        Return a binary file object over one of the tz database files.
+        """
+        if self.archive:
+            if filename not in self.members:
+                raise IOError("File '%s' doesn't exist in '%s'" % (filename, self.tzpath))
+            return self.archive.extractfile(self.members[filename])
+
+        tz_file = os.path.join(self.tzpath, filename)
+        if not os.path.exists(tz_file):
+            raise IOError("File '%s' doesn't exist" % tz_file)
+        return open(tz_file, "rb")
+
+
+    def close(self):
+        if self.archive:
+            self.archive.close()
+
+
+class ZoneLocation(object):
+    """
+    [country code, coordinates, TZ, comments] row of zone.tab, the
+    coordinates as decimal degrees.
+    """
+    __slots__ = ("country_code", "latitude", "longitude", "name", "comments")
+
+    def __init__(self, country_code, coordinates, name, comments=None):
+        self.country_code = internString(country_code.upper())
+        self.latitude, self.longitude = parseCoordinates(coordinates)
+        self.name = name
+        self.comments = comments
+
+
+    def getCountryCode(self):
+        return self.country_code
+
+
+    def getLatitude(self):
+        return self.latitude
 
-def parseZoneFile():
+
+    def getLongitude(self):
+        return self.longitude
+
+
+    def getName(self):
+        return self.name
+
+
+    def getComments(self):
+        return self.comments
+
+
+    def toJSON(self):
+        """
+        [name, country code, latitude, longitude] with the coordinates in
+        seconds of arc, periods.js divides them by 3600 as parseCoordinates does.
+        """
+        return [self.name.lower(), self.country_code, int(round(self.latitude * 3600)), int(round(self.longitude * 3600))]
+
+
+def parseCoordinates(coordinates):
+    """
+    Convert ISO 6709 +-DDMM+-DDDMM or +-DDMMSS+-DDDMMSS coordinates to a
+    (latitude, longitude) tuple of decimal degrees.
+    """
+    match = re.match(r"^([+-])(\d\d)(\d\d)(\d\d)?([+-])(\d\d\d)(\d\d)(\d\d)?$", coordinates)
+    if not match:
+        raise ValueError("Invalid ISO 6709 coordinates '%s'" % coordinates)
+    fields = match.groups()
+    degrees = []
+    for sign, whole, minutes, seconds in (fields[:4], fields[4:]):
+        value = (int(whole) * 3600 + int(minutes) * 60 + int(seconds or 0)) / 3600.0
+        degrees.append(-value if sign == "-" else value)
+    return tuple(degrees)
+
+
+def parseZoneFile(source, locations=None):
     """
     Information about the file being parsed:
 
@@ -445,19 +957,18 @@ def parseZoneFile():
         first latitude (+ is north), then longitude (+ is east).
     3.  Zone name used in value of TZ environment variable.
     4.  Comments; present if and only if the country has multiple rows.
+
+    When a locations list is given, a ZoneLocation is appended to it for
+    each row.
     """
 
     tmp_zones = {}
 
-    zone_file = os.path.join(tzpath,"zone.tab")
+    zones = source.open("zone.tab")
 
-    if not os.path.exists(zone_file):
-        print "File '%s' doesn't exist" % zone_file
-        sys.exit(2)
-
-    zones = open( zone_file, "r")
+    for line in zones:
+        line = nativeString(line)
 
-    for line in zones.readlines():
         # Skip full line comments
         if re.search(r"^\w*#", line):
             continue
@@ -466,11 +977,14 @@ def parseZoneFile():
         # after 1st split and then split the remainder as a tab delimited record.
         rec = line.strip("\n").split("#",1)[0].strip().split("\t")
 
+        if locations is not None:
+            locations.append(ZoneLocation(rec[0], rec[1], rec[2], len(rec) > 3 and rec[3] or None))
+
         # The only information required are Zone names.  They're split
         # into Area and Location.
         area, location = rec[2].lower().split("/",1)
 
-        if not tmp_zones.has_key(area):
+        if area not in tmp_zones:
             tmp_zones[area] = {}
         tmp_zones[area][location] = []
 
@@ -480,7 +994,205 @@ def parseZoneFile():
 
 
 
-def parseRuleZoneFile(filename, zones={}, rules={}):
+class ZoneLocator(object):
+    """
+    Spatial index over the zone.tab locations for nearest zone queries.
+
+    The locations are converted to points on the unit sphere and laid out
+    as an implicit k-d tree: the root of the range [lo, hi) is at
+    (lo + hi) // 2 and splits on axis depth % 3, the points before it are
+    its left subtree and those after it the right one.  The same layout is
+    emitted for periods.js with --locations.
+    """
+    def __init__(self, locations):
+        self.countries = {}
+        for location in locations:
+            self.countries.setdefault(location.getCountryCode(), []).append(location.getName())
+        points = [(self.toPoint(location.getLatitude(), location.getLongitude()), location) for location in locations]
+        self.locations = []
+        self.points = []
+        self.layout(points, 0)
+
+
+    @staticmethod
+    def toPoint(latitude, longitude):
+        latitude, longitude = math.radians(latitude), math.radians(longitude)
+        return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude))
+
+
+    def layout(self, points, depth):
+        if not points:
+            return
+        points.sort(key=lambda point: point[0][depth % 3])
+        middle = len(points) // 2
+        self.layout(points[:middle], depth + 1)
+        self.points.append(points[middle][0])
+        self.locations.append(points[middle][1])
+        self.layout(points[middle+1:], depth + 1)
+
+
+    def nearest(self, latitude, longitude):
+        """
+        Return the ZoneLocation closest to the coordinates in decimal degrees,
+        or None when there are no locations.
+        """
+        target = self.toPoint(latitude, longitude)
+        best, best_distance = None, 5.0     # Squared chord lengths are at most 4.
+        # Ranges still to search, with the squared distance to their side of the split.
+        stack = [(0, len(self.points), 0, 0.0)]
+        while stack:
+            lo, hi, depth, bound = stack.pop()
+            if lo >= hi or bound >= best_distance:
+                continue
+            middle = (lo + hi) // 2
+            point = self.points[middle]
+            distance = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if distance < best_distance:
+                best, best_distance = middle, distance
+            delta = target[depth % 3] - point[depth % 3]
+            if delta < 0:
+                stack.append((middle + 1, hi, depth + 1, delta * delta))
+                stack.append((lo, middle, depth + 1, 0.0))
+            else:
+                stack.append((lo, middle, depth + 1, delta * delta))
+                stack.append((middle + 1, hi, depth + 1, 0.0))
+        return best is not None and self.locations[best] or None
+
+
+    def nearestZone(self, latitude, longitude):
+        """
+        Return the name of the zone whose principal location is closest to
+        the coordinates, e.g. nearestZone(48.85, 2.35) is 'Europe/Paris'.
+        """
+        location = self.nearest(latitude, longitude)
+        return location and location.getName()
+
+
+    def zonesForCountry(self, country_code):
+        """
+        Return the names of the zones of an ISO 3166 country code, in
+        zone.tab order.
+        """
+        return list(self.countries.get(country_code.upper(), []))
+
+
+def loadCachedRecords(cache_file):
+    """
+    Return the records pickled in a build cache file, or None when the file
+    is missing or unreadable.
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        cfh = open(cache_file, "rb")
+        try:
+            return pickle.load(cfh)
+        finally:
+            cfh.close()
+    except Exception as e:
+        logging.warning( "Ignoring unreadable cache file '%s': %s", cache_file, e )
+    return None
+
+
+def storeCachedRecords(cache_file, records):
+    """
+    Pickle records into a build cache file.  It's written under a temporary
+    name and renamed so concurrent builds never read a partial file.
+    """
+    if not os.path.isdir(os.path.dirname(cache_file)):
+        os.makedirs(os.path.dirname(cache_file))
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    cfh = open(tmp_file, "wb")
+    pickle.dump(records, cfh, pickle.HIGHEST_PROTOCOL)
+    cfh.close()
+    os.rename(tmp_file, cache_file)
+
+
+def readContent(job):
+    """
+    Run a reader over the content of a tz database file.  job is a
+    (reader, content) tuple so it can be sent to a pool worker.  Returns
+    the records and the seconds spent reading them.
+    """
+    reader, content = job
+    start = time.time()
+    records = reader(nativeString(content).splitlines(True))
+    return records, time.time() - start
+
+
+def readTzFiles(source, filenames, reader, jobs=1, cache_dir=None, profile=None):
+    """
+    Return the records reader produces from the lines of each tz database
+    file, in the same order as filenames.
+
+    With a build cache directory, the records are pickled under a hash of
+    the file's content and reused until the file changes.  With more than
+    one job, the files which need reading are handed to a pool of worker
+    processes, each producing the isolated records of one file.
+
+    A Profile, when given, records each file's line count and read time.
+    """
+    results = []
+    if not cache_dir and jobs == 1:
+        # Nothing to hash or hand over, stream the lines straight into the reader.
+        for filename in filenames:
+            start = time.time()
+            tz_file = source.open(filename)
+            lines = (nativeString(line) for line in tz_file)
+            if profile:
+                lines = list(lines)
+            results.append( reader(lines) )
+            tz_file.close()
+            if profile:
+                profile.addFile(filename, len(lines), time.time() - start)
+        return results
+
+    pending = []
+    for filename in filenames:
+        tz_file = source.open(filename)
+        content = tz_file.read()
+        tz_file.close()
+
+        start = time.time()
+        cache_file = None
+        records = None
+        if cache_dir:
+            # Pickles aren't shared between Python versions, so the version is part of the key.
+            key = hashlib.sha1( ("%s:%s:%s:" % (CACHE_VERSION, sys.version_info[0], reader.__name__)).encode("ascii") + content )
+            cache_file = os.path.join(cache_dir, "%s.pickle" % key.hexdigest())
+            records = loadCachedRecords(cache_file)
+        if records is None:
+            pending.append( (len(results), content, cache_file) )
+        else:
+            logging.info( "Using cached records for '%s'", filename )
+            if profile:
+                profile.addFile(filename, content.count(b"\n"), time.time() - start, True)
+        results.append(records)
+
+    jobs = min(jobs, len(pending))
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            parsed = pool.map(readContent, [(reader, content) for index, content, cache_file in pending])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        parsed = [readContent( (reader, content) ) for index, content, cache_file in pending]
+
+    for (index, content, cache_file), (records, seconds) in zip(pending, parsed):
+        results[index] = records
+        if cache_file:
+            storeCachedRecords(cache_file, records)
+        if profile:
+            profile.addFile(filenames[index], content.count(b"\n"), seconds)
+    if profile:
+        # Keep the report in the order of filenames rather than cached files first.
+        profile.files.sort(key=lambda filename: filenames.index(filename) if filename in filenames else -1)
+    return results
+
+
+def readRuleZoneFile(lines):
     """
     Information about the files being parsed:
 
@@ -497,139 +1209,1405 @@ def parseRuleZoneFile(filename, zones={}, rules={}):
 
     Link's to an already established timezone.
     Link    Antarctica/McMurdo  Antarctica/South_Pole
+
+    Returns the file's records in order: TimeZone and TimeZoneRule objects
+    and (source, target) tuples for Links.  Nothing is pruned at this stage.
     """
 
     # variables used to track values over multiple lines.
     context = ""
     tmp_location = ""
+    records = []
 
-    rule_zone_file = os.path.join(tzpath, filename)
-    if not os.path.exists(rule_zone_file):
-        print "File '%s' doesn't exist" % rule_zone_file
-        sys.exit(2)
+    for line in lines:
+        # Remove trailing comments, full line comments become empty.
+        line = line.split("#", 1)[0]
 
-    zfh = open(rule_zone_file, "r")
-    for line in zfh.readlines():
-        # Skip full line comments
-        if re.search(r"^\s*#", line):
+        # Classify the line once from its first character, skipping empty lines.
+        # Zone continuation lines start with white space.
+        if not line.strip():
             continue
-
-        # Remove carriage returns and trailing comments.
-        line = line.strip("\n").split('#',1)[0]
-
-        # Skip empty lines.
-        if re.search(r"^$", line):
-            continue
-
-        # Identify the type of line to process.
-        line_match = re.search('^(.)', line)
-
-        # Get the context of the line either: Zone, Rule or Link.
-        if line_match.groups()[0] != '\t':
-            context = line_match.groups()[0]
+        first = line[:1]
+        if first not in " \t":
+            context = first.lower()
+        elif context != "z":
+            raise ValueError("UNKNOWN LINE! %s" % line)
 
         # Extract the fields from the line.
-        if context.lower() == "z":
-            if line_match.groups()[0].lower() == "z":
-                r = re.search('^(Z[^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s*(.*)$', line)
-                if r:
-                    tmp = list( r.groups() )
-                    tmp.pop(0) # Throw away the "Zone" keyword.
-
-                    # Some lines don't explicitly have the zone's location so it's set here.
-                    # Location is also forced to lower case to simplfy referencing zone's keys.
-                    tmp_location = tmp[0].lower()
-                    logging.debug("parseRuleZone: Got location as = %s" % ( tmp_location ) )
-                else:
+        if context == "z":
+            if first == "Z":
+                # Zone  NAME  GMTOFF  RULES  FORMAT  [UNTIL]
+                tmp = line.split(None, 5)
+                if len(tmp) < 5:
                     raise ValueError("Zone doesn't match expected format %s" % line)
-            elif re.search('^\s', line_match.groups()[0]):
+                tmp.pop(0) # Throw away the "Zone" keyword.
+
+                # Some lines don't explicitly have the zone's location so it's set here.
+                # Location is also forced to lower case to simplfy referencing zone's keys.
+                tmp_location = tmp[0].lower()
+                if DEBUG:
+                    logging.debug("parseRuleZone: Got location as = %s", tmp_location)
+            elif first in " \t":
                 #           -4:32:36 1:00   BOST    1932 Mar 21 # Bolivia ST
-                r = re.search('^\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)(.*)$', line)
-                if r:
-                    # Zone lines without explicit locations use the
-                    # last explicitly mentioned zone location.
-                    tmp = [tmp_location]
-                    tmp.extend( list( r.groups() ) )
-                    logging.debug("parseRuleZone: set location to = %s" % ( tmp_location ) )
-                else:
+                tmp = line.split(None, 3)
+                if len(tmp) < 3:
                     raise ValueError("Zone doesn't match expected format %s" % line)
+                # Zone lines without explicit locations use the
+                # last explicitly mentioned zone location.
+                tmp.insert(0, tmp_location)
+                if DEBUG:
+                    logging.debug("parseRuleZone: set location to = %s", tmp_location)
             else:
-                logging.debug( "UNKNOWN ZONE FORMAT! %s" % line )
-                continue
+                raise ValueError("Zone doesn't match expected format %s" % line)
 
-            # Strip white space from last field.
+            # Strip white space from the UNTIL field, which may be absent.
+            if len(tmp) == 4:
+                tmp.append("")
             tmp[4] = tmp[4].strip()
 
-            tmpzone = TimeZone(*tmp)
+            records.append( TimeZone(*tmp) )
+
+        elif context == "r":
+            # Rule  NAME  FROM  TO  TYPE  IN  ON  AT  SAVE  LETTER/S
+            tmp = line.split(None, 9)
+            if first != "R" or len(tmp) < 9:
+                raise ValueError("UNKOWN RULE FORMAT! %s" % line)
+            tmp.pop(0) # discard "Rule" field.
+            if len(tmp) == 8:
+                tmp.append("")
+
+            records.append( TimeZoneRule(*tmp) )
+
+        elif context == "l":
+            # Link  Europe/Rome Europe/Vatican  (Link SOURCE TARGET)
+            tmp = line.split()
+            if first != "L" or len(tmp) < 3:
+                raise ValueError("UNKNOWN LINK FORMAT! %s" % line)
+            tmp.pop(0) # discard "Link" field.
+
+            records.append( (tmp[0], tmp[1]) )
+
+        else:
+            raise ValueError("UNKNOWN LINE! %s" % line)
+    return records
+
+
+def parseRuleZoneFile(source, filename, zones, rules, window=None):
+    """
+    Parse a Zone/Rule/Link file into zones and rules.  See readRuleZoneFile.
+
+    window is a (year_from, year_to) tuple, zones and rules outside it are
+    pruned.  When it's None the complete history is kept.
+    """
+    return mergeRuleZoneRecords(readTzFiles(source, [filename], readRuleZoneFile)[0], zones, rules, window)
 
-            if not zones.has_key(tmpzone.getArea()):
-                logging.warning( "A zone area which wasn't defined has been added. %s" % tmpzone.getArea() )
+
+def mergeRuleZoneRecords(records, zones, rules, window=None, link_records=None, counts=None):
+    """
+    Add the records of a Zone/Rule/Link file to zones and rules.  Files are
+    merged in the order of zone_files so the result doesn't depend on how
+    they were read.
+
+    Links are resolved immediately unless a link_records list is given, in
+    which case they're appended to it for resolveLinks once every file is
+    merged.  Zone lines and rules outside the (year_from, year_to) window
+    are pruned and the rest are clamped to it, unless window is None.
+
+    counts, a Profile.getCounts dict, tallies the records kept and discarded.
+    """
+    for record in records:
+        if isinstance(record, TimeZone):
+            tmpzone = record
+            if tmpzone.getArea() not in zones:
+                logging.warning( "A zone area which wasn't defined has been added. %s", tmpzone.getArea() )
                 zones[tmpzone.getArea()] = {}
 
-            if not zones[tmpzone.getArea()].has_key(tmpzone.getLocation()):
-                logging.warning( "A zone location which wasn't defined has been added. %s" % tmpzone.getLocation() )
+            if tmpzone.getLocation() not in zones[tmpzone.getArea()]:
+                logging.warning( "A zone location which wasn't defined has been added. %s", tmpzone.getLocation() )
                 zones[tmpzone.getArea()][tmpzone.getLocation()] = []
 
-            if tmpzone.isCurrent():
+            if window is None:
+                zones[tmpzone.getArea()][tmpzone.getLocation()].append( tmpzone )
+            elif tmpzone.isInWindow(*window):
+                tmpzone.clampToWindow(*window)
                 zones[tmpzone.getArea()][tmpzone.getLocation()].append( tmpzone )
+            elif counts is not None:
+                counts["zones_discarded"] += 1
+                continue
+            if counts is not None:
+                counts["zones_kept"] += 1
+
+        elif isinstance(record, TimeZoneRule):
+            tmprule = record
+            if tmprule.getName() not in rules:
+                rules[tmprule.getName()] = []
+
+            if window is None:
+                rules[tmprule.getName()].append( tmprule )
+            elif tmprule.isInWindow(*window):
+                tmprule.clampToWindow(*window)
+                rules[tmprule.getName()].append( tmprule )
+            elif counts is not None:
+                counts["rules_discarded"] += 1
+                continue
+            if counts is not None:
+                counts["rules_kept"] += 1
 
-        elif context.lower() == "r":
-            r = re.search("^(R[^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)\s+([^\s]+)(.*)", line)
-            if r:
-                tmp = list(r.groups())
-                tmp.pop(0) # discard "Rule" field.
+        else:
+            if counts is not None:
+                counts["links"] += 1
+            if link_records is None:
+                resolveLinks(zones, [record])
+            else:
+                link_records.append(record)
 
-                if not rules.has_key(tmp[0]):
-                    rules[tmp[0]] = []
+    return rules
 
-                tmprule = TimeZoneRule(*tmp)
-                if tmprule.isCurrent():
-                    rules[tmp[0]].append( tmprule )
-            else:
-                raise ValueError("UNKOWN RULE FORMAT! %s" % line)
 
-        elif context.lower() == "l":
-            r = re.search("^(L[^\s]+)\s+([^\s]+)\s+([^\s]+)", line)
-            if r:
-                tmp = list(r.groups())
-                tmp.pop(0) # discard "Link" field.
-
-                # Link  Europe/Rome Europe/Vatican  (Link SOURCE TARGET)
-                # Force to lower case to simply zone's key references.
-                src = tmp[0].lower().split("/",1)
-                if len(src) == 1:
-                    src.append(None)
-                src_area, src_location = src
-
-                tgt = tmp[1].lower().split("/",1)
-                if len(tgt) == 1:
-                    tgt.append(None)
-                tgt_area, tgt_location = tgt
-
-                if not zones.has_key(tgt_area):
-                    zones[tgt_area] = {}
-
-                # This doesn't handle multiple zones correctly.  Fix it?
-                zones[tgt_area][tgt_location] = zones[src_area][src_location]
-                logging.debug("Linked: %s to %s" % (zones[tgt_area][tgt_location], zones[src_area][src_location]) )
+def resolveLinks(zones, link_records):
+    """
+    Point each Link's target at the zone lines of its source.
+    """
+    for src_name, tgt_name in link_records:
+        # Link  Europe/Rome Europe/Vatican  (Link SOURCE TARGET)
+        # Force to lower case to simply zone's key references.
+        src = src_name.lower().split("/",1)
+        if len(src) == 1:
+            src.append(None)
+        src_area, src_location = src
+
+        tgt = tgt_name.lower().split("/",1)
+        if len(tgt) == 1:
+            tgt.append(None)
+        tgt_area, tgt_location = tgt
+
+        if tgt_area not in zones:
+            zones[tgt_area] = {}
+
+        # This doesn't handle multiple zones correctly.  Fix it?
+        zones[tgt_area][tgt_location] = zones[src_area][src_location]
+        logging.debug("Linked: %s to %s", tgt_name, src_name)
+
+
+def zoneName(area, location):
+    """
+    Return the lower case 'area/location' name of a zones key, or 'area' for
+    zones without a location.
+    """
+    if location is None:
+        return area
+    return "%s/%s" % (area, location)
+
+
+def splitLinks(zones):
+    """
+    Separate Links from the zones.  A Link shares the zone lines of its
+    target, so only the zone named by those lines is kept and every other
+    name referring to them is returned in links as an alias:
+    {'europe/vatican': ['europe', 'rome']}
+    """
+    owners = {}
+    for area in zones.keys():
+        for location, zone in zones[area].items():
+            if zone and (zone[0].getArea(), zone[0].getLocation()) == (area, location):
+                owners[id(zone)] = [area, location]
+
+    # Sorted so lines shared without an owner are always attributed the same way.
+    kept = {}
+    links = {}
+    for area in sorted(zones.keys()):
+        for location in sorted(zones[area].keys(), key=str):
+            zone = zones[area][location]
+            owner = owners.setdefault(id(zone), [area, location])
+            if owner == [area, location]:
+                kept.setdefault(area, {})[location] = zone
             else:
-                raise ValueError("UNKNOWN LINK FORMAT! %s" % line)
+                links[zoneName(area, location)] = owner
+    return kept, links
+
+
+def selectZones(zones, rules, patterns, areas):
+    """
+    Return the subset of zones matching the zone names/glob patterns or
+    areas, together with the Link targets and rules they reference.
+
+    Names are matched as 'area/location', or 'area' for zones without a
+    location, in lower case like the zones keys.
+    """
+    patterns = [p.lower() for p in patterns]
+    areas = [a.lower() for a in areas]
+    matched = dict.fromkeys(patterns + areas, False)
+
+    selected = {}
+    for area in zones.keys():
+        for location, zone in zones[area].items():
+            name = zoneName(area, location)
+            hits = [p for p in patterns if fnmatch.fnmatchcase(name, p)]
+            if area in areas:
+                hits.append(area)
+            if not hits:
+                continue
+            for hit in hits:
+                matched[hit] = True
+            selected.setdefault(area, {})[location] = zone
+
+            # A Link shares the zone lines of its target, which is named by the Zone line itself.
+            if zone and (zone[0].getArea(), zone[0].getLocation()) != (area, location):
+                selected.setdefault(zone[0].getArea(), {})[zone[0].getLocation()] = zone
+
+    for name, found in matched.items():
+        if not found:
+            logging.warning( "No zone matches '%s'", name )
+
+    selected_rules = {}
+    for area in selected.keys():
+        for zone in selected[area].values():
+            for zone_line in zone:
+                if zone_line.getRules() in rules:
+                    selected_rules[zone_line.getRules()] = rules[zone_line.getRules()]
+    return selected, selected_rules
+
+
+def loadTzData(tzpath, window=None, jobs=1, cache_dir=None, profile=None, zone_names=(), zone_areas=(), locations=None):
+    """
+    Parse the tzdata directory or tarball at tzpath, keep the zones named
+    by zone_names or zone_areas when either is given and split off the
+    Links.  Returns (zones, rules, links).  A locations list collects the
+    ZoneLocation of the zones kept.
+    """
+    source = TzSource(tzpath)
+    all_locations = []
+    try:
+        zones, rules = parseTzData(source, window, jobs, cache_dir, profile, all_locations)
+    finally:
+        source.close()
+    if zone_names or zone_areas:
+        zones, rules = selectZones(zones, rules, zone_names, zone_areas)
+    zones, links = splitLinks(zones)
+    if locations is not None:
+        names = set(links)
+        for area in zones.keys():
+            names.update(zoneName(area, location) for location in zones[area].keys())
+        locations.extend(location for location in all_locations if location.getName().lower() in names)
+    return zones, rules, links
+
+
+def diffEntries(old, new, depth, render=lambda value: value, convert=lambda value: value):
+    """
+    Compare two {area: {location: value}} (depth 2) or {name: value} (depth 1)
+    structures.  Returns the entries of new whose render differs from old,
+    passed through convert, and None for the entries only old has.
+    """
+    changes = {}
+    for key in sorted(set(old) | set(new), key=str):
+        if depth > 1:
+            nested = diffEntries(old.get(key, {}), new.get(key, {}), depth - 1, render, convert)
+            if nested:
+                changes[key] = nested
+        elif key not in new:
+            changes[key] = None
+        elif key not in old or render(old[key]) != render(new[key]):
+            changes[key] = convert(new[key])
+    return changes
+
+
+def buildPatch(old, new, window, compiled=False, packed=False, index=False):
+    """
+    Build the patch which turns the output of old into the output of new,
+    both (zones, rules, links) as returned by loadTzData.  Only the links,
+    zones and rule sets (or compiled transitions and their bucket index)
+    which were added or changed are included, removed ones are None.
+    Packed values and abbreviation indexes refer to tables of the patch's own.
+    """
+    (old_zones, old_rules, old_links), (zones, rules, links) = old, new
+    encoder = PackedEncoder()
+    patch = {"links": diffEntries(old_links, links, 1)}
+    if compiled:
+        table = AbbreviationTable()
+        convert = table.indexTransitions
+        if packed:
+            convert = lambda transitions: encoder.packTransitions(table.indexTransitions(transitions))
+        old_transitions = compileTransitions(old_zones, old_rules, window[0], window[1])
+        new_transitions = compileTransitions(zones, rules, window[0], window[1])
+        patch["transitions"] = diffEntries(old_transitions, new_transitions, 2, convert=convert)
+        patch["tz_abbreviations"] = table.abbreviations
+        if index:
+            start, end = calendar.timegm((window[0], 1, 1, 0, 0, 0)), calendar.timegm((window[1] + 1, 1, 1, 0, 0, 0))
+            patch["transition_index"] = diffEntries(old_transitions, new_transitions, 2,
+                convert=lambda transitions: transitionIndex(transitions, start, end))
+    else:
+        render = lambda records: [record.toJSONText() for record in records]
+        patch["zones"] = diffEntries(old_zones, zones, 2, render, packed and encoder.packZone or (lambda zone: zone))
+        patch["rules"] = diffEntries(old_rules, rules, 1, render, packed and encoder.packRules or (lambda rule_set: rule_set))
+        if packed:
+            patch["tz_strings"] = encoder.strings
+    return patch
+
+
+def dayOfMonth(year, month, day_on):
+    """
+    Resolve a Rule ON field, as returned by parseDayOn, to the day of the
+    month for the given year.  e.g. (6, "<=", "last") for lastSun or (6, ">=", 8) for Sun>=8
+
+    The result may fall outside the month (Sun>=29 can land in the next month),
+    calendar.timegm handles the overflow when it's converted to seconds.
+    """
+    day, comp, dom = day_on
+    if dom == "last":
+        dom = calendar.monthrange(year, month)[1]
+
+    if day is None:
+        return dom
+
+    if comp == ">=":
+        return dom + (day - calendar.weekday(year, month, dom)) % 7
+    return dom - (calendar.weekday(year, month, dom) - day) % 7
+
+
+def splitTimeSuffix(time_at):
+    """
+    Split a time of day such as "2:00s" into its number of seconds and the
+    zic(8) suffix: w (wall clock, the default), s (standard) or u (universal).
+    g and z are synonyms for u.
+    """
+    time_at = str(time_at)
+    suffix = "w"
+    if time_at[-1:].isalpha():
+        suffix = time_at[-1:]
+        time_at = time_at[:-1]
+    if suffix in "gz":
+        suffix = "u"
+    return TimeZoneBase._TimeToSeconds(time_at or "0"), suffix
+
+
+def toUTC(seconds, suffix, gmt_off, save):
+    """
+    Convert a naive date/time in seconds to UTC according to its zic(8) suffix.
+    """
+    if suffix == "u":
+        return seconds
+    if suffix == "s":
+        return seconds - gmt_off
+    return seconds - gmt_off - save
+
+
+def formatAbbreviation(zone_format, letters, gmt_off, save):
+    """
+    Expand a Zone FORMAT field into the abbreviation in effect.  Handles the
+    "CE%sT", "GMT/BST" and "%z" forms.
+    """
+    if zone_format.find("/") != -1:
+        return zone_format.split("/", 1)[save != 0]
+    if zone_format.find("%s") != -1:
+        return zone_format.replace("%s", letters)
+    if zone_format.find("%z") != -1:
+        offset = gmt_off + save
+        hours, rest = divmod(abs(offset), 3600)
+        minutes, seconds = divmod(rest, 60)
+        numeric = "%s%02d" % (offset < 0 and "-" or "+", hours)
+        if minutes or seconds:
+            numeric += "%02d" % minutes
+        if seconds:
+            numeric += "%02d" % seconds
+        return zone_format.replace("%z", numeric)
+    return zone_format
+
+
+def daysFromCivil(year, month, day):
+    """
+    Return the days since 1st Jan 1970 of proleptic Gregorian dates, for
+    numpy arrays of years, months and days.  Days past the end of the month
+    carry over into the next, as calendar.timegm does.
+    """
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    return era * 146097 + year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year - 719468
+
+
+class RuleColumns(object):
+    """
+    The rules of every rule set as parallel numpy arrays: rule set, years,
+    month, kind of ON day, weekday, day of the month, AT seconds, suffix,
+    save and letters.  expand computes the naive transitions of every rule
+    in a range of years with array arithmetic instead of a loop per year.
+    """
+    # Kinds of ON day, a fixed day of the month or a weekday on or after/before one.
+    DAY_FIXED, DAY_ON_OR_AFTER, DAY_ON_OR_BEFORE = 0, 1, 2
+
+    def __init__(self, rules):
+        self.names = sorted(rules)
+        # Codes in sorting order so rules sort by code as getYear sorts by value.
+        self.suffixes = ["s", "u", "w"]
+        self.letters = sorted(set(rule.getLetters() for rule_set in rules.values() for rule in rule_set))
+        suffix_codes = dict((suffix, code) for code, suffix in enumerate(self.suffixes))
+        letters_codes = dict((letters, code) for code, letters in enumerate(self.letters))
+
+        columns = []
+        for name_code, name in enumerate(self.names):
+            for rule in rules[name]:
+                day, comp, dom = rule.getDayOn()
+                at, suffix = splitTimeSuffix(rule.getTimeAt()[0] + (rule.getTimeAt()[1] or ""))
+                if day is None:
+                    kind = self.DAY_FIXED
+                elif comp == ">=":
+                    kind = self.DAY_ON_OR_AFTER
+                else:
+                    kind = self.DAY_ON_OR_BEFORE
+                columns.append( (name_code, rule.getYearFrom(), rule.getYearTo(), rule.getMonthIn(), kind,
+                    day or 0, 0 if dom == "last" else dom, at, suffix_codes[suffix], rule.getSave(), letters_codes[rule.getLetters()]) )
+        array = numpy.array(columns, dtype=numpy.int64).reshape(-1, 11)
+        (self.name, self.year_from, self.year_to, self.month, self.kind, self.weekday, self.day,
+            self.at, self.suffix, self.save, self.letters_code) = array.T
+
+
+    def expand(self, year_from, year_to):
+        """
+        Return {(rule name, year): chronological [(naive seconds, suffix,
+        save, letters)]} for the inclusive year range, the same lists as
+        RuleExpander.getYear.  Years in which a rule set has no rules are
+        left out.
+        """
+        # One row per (rule, year) the rule is in effect for.
+        first = numpy.maximum(self.year_from, year_from)
+        counts = numpy.maximum(numpy.minimum(self.year_to, year_to) - first + 1, 0)
+        rows = numpy.repeat(numpy.arange(len(counts)), counts)
+        year = first[rows] + numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        month = self.month[rows]
+        kind = self.kind[rows]
+        weekday = self.weekday[rows]
+
+        first_day = daysFromCivil(year, month, 1)
+        month_length = daysFromCivil(year + (month == 12), month % 12 + 1, 1) - first_day
+        # A day of 0 is the last day of the month.  1st Jan 1970 was a Thursday, Mon is 0.
+        day = first_day + numpy.where(self.day[rows] == 0, month_length, self.day[rows]) - 1
+        day_weekday = (day + 3) % 7
+        day = numpy.where(kind == self.DAY_ON_OR_AFTER, day + (weekday - day_weekday) % 7, day)
+        day = numpy.where(kind == self.DAY_ON_OR_BEFORE, day - (day_weekday - weekday) % 7, day)
+        naive = day * 86400 + self.at[rows]
+
+        name, suffix, save, letters = self.name[rows], self.suffix[rows], self.save[rows], self.letters_code[rows]
+        order = numpy.lexsort( (letters, save, suffix, naive, year, name) )
+        name, year = name[order], year[order]
+        entries = list(zip(naive[order].tolist(), [self.suffixes[code] for code in suffix[order].tolist()],
+            save[order].tolist(), [self.letters[code] for code in letters[order].tolist()]))
+
+        expanded = {}
+        bounds = numpy.flatnonzero( (numpy.diff(name) != 0) | (numpy.diff(year) != 0) ) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(entries)]
+        for start, end, name_code, entry_year in zip(starts, ends, name[starts].tolist(), year[starts].tolist()):
+            if start < end:
+                expanded[(self.names[name_code], entry_year)] = entries[start:end]
+        return expanded
+
+
+class RuleExpander(object):
+    """
+    Memoize rule set expansions for compileZone.  Each (rule name, year) is
+    expanded once into naive transitions and shared by every zone using the
+    rule set, zones only apply their own offsets to them.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.years = {}
+        self.letters = {}
+        self.times = {}
+        self.ranges = {}
+        self.arrays = {}
+        # The years prefill expanded, those it left out have no rules.
+        self.prefilled = (1, 0)
+        # Expansions are only memoized within the build window, others are
+        # computed each time, so queries of any year don't grow the memos.
+        self.window = (1, MAX_YEAR)
+
+
+    def prefill(self, year_from, year_to):
+        """
+        Expand every rule set for the inclusive year range at once with
+        RuleColumns, so getYear only looks them up.  Without numpy, the
+        years are expanded one by one as getYear is called.  Expansions of
+        years outside the range aren't memoized from then on.
+        """
+        self.window = (year_from, year_to)
+        if numpy is None or not self.rules:
+            return
+        self.years.update( RuleColumns(self.rules).expand(year_from, year_to) )
+        self.prefilled = (year_from, year_to)
+
 
+    def getYear(self, rule_name, year):
+        """
+        Return the chronological (naive seconds, suffix, save, letters) of a rule set in a year.
+        """
+        key = (rule_name, year)
+        if key not in self.years:
+            if self.prefilled[0] <= year <= self.prefilled[1]:
+                return []
+            # The AT field of each rule is only converted to seconds once.
+            if rule_name not in self.times:
+                self.times[rule_name] = [(rule,) + splitTimeSuffix(rule.getTimeAt()[0] + (rule.getTimeAt()[1] or ""))
+                    for rule in self.rules.get(rule_name, [])]
+            expanded = []
+            for rule, at, suffix in self.times[rule_name]:
+                if rule.getYearFrom() <= year <= rule.getYearTo():
+                    dom = dayOfMonth(year, rule.getMonthIn(), rule.getDayOn())
+                    naive = calendar.timegm((year, rule.getMonthIn(), dom, 0, 0, 0)) + at
+                    expanded.append( (naive, suffix, rule.getSave(), rule.getLetters()) )
+            expanded.sort()
+            if self.window[0] <= year <= self.window[1]:
+                self.years[key] = expanded
+            return expanded
+        return self.years[key]
+
+
+    def expand(self, rule_name, year_from, year_to):
+        """
+        Return a rule set's chronological (naive seconds, suffix, save,
+        letters) for the inclusive year range, see getYear.  Zone lines in
+        effect over the same years share them.
+        """
+        key = (rule_name, year_from, year_to)
+        if key not in self.ranges:
+            expanded = []
+            for year in range(year_from, year_to + 1):
+                expanded.extend(self.getYear(rule_name, year))
+            if not self.window[0] <= year_from <= year_to <= self.window[1]:
+                return expanded
+            self.ranges[key] = expanded
+        return self.ranges[key]
+
+
+    def expandArrays(self, rule_name, year_from, year_to):
+        """
+        Return expand's transitions as numpy arrays of (naive seconds, 1
+        unless the AT is UTC, 1 for wall clock ATs, save, letters codes) and
+        the list of letters the codes refer to.  Zone lines in effect over
+        the same years share them.
+        """
+        key = (rule_name, year_from, year_to)
+        if key not in self.arrays:
+            expanded = self.expand(rule_name, year_from, year_to)
+            letters = sorted(set(entry[3] for entry in expanded))
+            codes = dict((value, code) for code, value in enumerate(letters))
+            arrays = (
+                numpy.array([entry[0] for entry in expanded], dtype=numpy.int64),
+                numpy.array([entry[1] != "u" for entry in expanded], dtype=numpy.int64),
+                numpy.array([entry[1] == "w" for entry in expanded], dtype=numpy.int64),
+                numpy.array([entry[2] for entry in expanded], dtype=numpy.int64),
+                numpy.array([codes[entry[3]] for entry in expanded], dtype=numpy.int64),
+                letters)
+            if not self.window[0] <= year_from <= year_to <= self.window[1]:
+                return arrays
+            self.arrays[key] = arrays
+        return self.arrays[key]
+
+
+    def getInitialLetters(self, rule_name):
+        """
+        Return the letters in use before any of a rule set's rules take effect,
+        those of its earliest standard time rule.
+        """
+        if rule_name not in self.letters:
+            self.letters[rule_name] = ""
+            for rule in sorted(self.rules.get(rule_name, []), key=lambda r: (r.getYearFrom(), r.getMonthIn())):
+                if rule.getSave() == 0:
+                    self.letters[rule_name] = rule.getLetters()
+                    break
+        return self.letters[rule_name]
+
+
+def untilAsNaive(zone_line):
+    """
+    Return a TimeZone's UNTIL field as (naive seconds, suffix) or None when
+    the zone line remains in effect up to MAX_YEAR.
+    """
+    until = zone_line.getYearUntil()
+    if until[0] >= MAX_YEAR:
+        return None
+    return calendar.timegm(until), zone_line.getUntilType()
+
+
+def ruleStateAt(expander, rule_name, utc, gmt_off, previous=None):
+    """
+    Return the (save, letters, naive seconds) of the most recent rule of a
+    rule set in effect at the given UTC instant.  Before any rule takes effect, the
+    letters of the earliest standard time rule are used and the naive
+    seconds are None.
+
+    previous is the (gmt_off, save) of the zone line ending at utc.  Like
+    zic(8), a rule taking effect when that line ends, by its clock, is in
+    effect from the start of the next line.
+    """
+    save = 0
+    letters = expander.getInitialLetters(rule_name)
+
+    # The UTC year may precede the local one, so the next year's rules are candidates too.
+    # Each rule's last years up to then are considered, rules may have ended long before.
+    year = time.gmtime(utc)[0] + 1
+    years = set()
+    for rule in expander.rules.get(rule_name, []):
+        last = min(rule.getYearTo(), year)
+        if last >= rule.getYearFrom():
+            years.update( range(last - 2, last + 1) )
+    candidates = []
+    for candidate_year in sorted(years):
+        candidates.extend( expander.getYear(rule_name, candidate_year) )
+
+    applied = None
+    for naive, suffix, rule_save, rule_letters in candidates:
+        if toUTC(naive, suffix, gmt_off, save) > utc and (previous is None or toUTC(naive, suffix, previous[0], previous[1]) > utc):
+            break
+        save, letters, applied = rule_save, rule_letters, naive
+    return save, letters, applied
+
+
+def compileTail(transitions, add, arrays, first, gmt_off, save, zone_format):
+    """
+    Apply a rule set's expanded transitions, RuleExpander.expandArrays,
+    from index first on to a zone line which remains in effect, with array
+    arithmetic instead of an add call for each of them.  Returns the
+    (save, letters) in effect after the last one, or None when they don't
+    fall on increasing instants and add has to resolve them one by one.
+    """
+    naive, local, wall, saves, letters_codes, letters = arrays
+    naive, local, wall, saves, letters_codes = naive[first:], local[first:], wall[first:], saves[first:], letters_codes[first:]
+    # Each AT is read on the clock of the save in effect until then.
+    previous = numpy.concatenate(([save], saves[:-1]))
+    utc = naive - local * gmt_off - wall * previous
+    if numpy.any(numpy.diff(utc) <= 0):
+        return None
+
+    # The abbreviation of each distinct (letters, save), coded so equal abbreviations compare equal.
+    lowest = int(saves.min())
+    pairs, inverse = numpy.unique(letters_codes * (int(saves.max()) - lowest + 1) + saves - lowest, return_inverse=True)
+    names = []
+    name_codes = []
+    for pair in pairs.tolist():
+        code, pair_save = divmod(pair, int(saves.max()) - lowest + 1)
+        abbreviation = formatAbbreviation(zone_format, letters[code], gmt_off, pair_save + lowest)
+        if abbreviation not in names:
+            names.append(abbreviation)
+        name_codes.append(names.index(abbreviation))
+    codes = numpy.array(name_codes, dtype=numpy.int64)[inverse.reshape(-1)]
+
+    # The first may supersede or repeat the previous zone line's last transition, add resolves it.
+    add(int(utc[0]), gmt_off, int(saves[0]), letters[int(letters_codes[0])])
+    # As in add, transitions which don't change the state are dropped.
+    keep = numpy.flatnonzero( (saves[1:] != saves[:-1]) | (codes[1:] != codes[:-1]) ) + 1
+    transitions.extend( map(list, zip(utc[keep].tolist(), (saves[keep] + gmt_off).tolist(), saves[keep].tolist(),
+        [names[code] for code in codes[keep].tolist()])) )
+    return int(saves[-1]), letters[int(letters_codes[-1])]
+
+
+def compileZone(zone, rules, year_from, year_to, expander=None):
+    """
+    Resolve a zone's lines and the rules they reference into a sorted list of
+    UTC transitions, the way zic(8) does.  Each transition is stored as
+    [UTC seconds, total UTC offset, daylight savings offset, abbreviation].
+
+    The first transition holds the state in effect at the start of year_from.
+    Zones compiled with the same RuleExpander share their rule expansions.
+    """
+    if expander is None:
+        expander = RuleExpander(rules)
+    transitions = []
+    window_start = calendar.timegm((year_from, 1, 1, 0, 0, 0))
+    window_end = calendar.timegm((year_to + 1, 1, 1, 0, 0, 0))
+    start = window_start
+    previous = None
+
+    def add(utc, gmt_off, save, letters):
+        state = [gmt_off + save, save, formatAbbreviation(zone_line.getFormat(), letters, gmt_off, save)]
+        if transitions and transitions[-1][0] == utc:
+            transitions.pop()           # Superseded by a zone line starting at the same instant.
+        if transitions and transitions[-1][1:] == state:
+            return
+        transitions.append([utc] + state)
+
+    for zone_line in zone:
+        gmt_off = zone_line.getGMTOffset()
+        rule_name = zone_line.getRules()
+        until = untilAsNaive(zone_line)
+        save = 0
+        letters = ""
+        expanded = []
+        applied = None
+
+        # Zone lines which ended more than a day before the window are skipped.
+        if until and toUTC(until[0], until[1], gmt_off, 0) + 86400 <= window_start:
+            continue
+
+        if rule_name == "-":
+            pass
+        elif re.match(r"^-?\d", rule_name):
+            # A fixed amount of daylight savings time.
+            save = zone_line._TimeToSeconds(rule_name)
         else:
-            raise ValueError("UNKNOWN LINE! %s" % line)
-    zfh.close()
+            if rule_name not in rules:
+                logging.warning( "Zone %s references undefined rule %s", zone_line.getName(), rule_name )
+            save, letters, applied = ruleStateAt(expander, rule_name, start, gmt_off, previous)
+            last_year = until and time.gmtime(until[0])[0] or year_to
+            expand_years = (time.gmtime(start)[0], min(last_year, year_to))
+            expanded = expander.expand(rule_name, *expand_years)
+
+        add(start, gmt_off, save, letters)
+        for index, (naive, suffix, rule_save, rule_letters) in enumerate(expanded):
+            utc = toUTC(naive, suffix, gmt_off, save)
+            if until and utc >= toUTC(until[0], until[1], gmt_off, save):
+                break
+            if utc > start and (applied is None or naive > applied):
+                # The rest of a long window's rules all apply to the last zone line.
+                if not until and numpy is not None and len(expanded) - index >= VECTOR_MIN_RULES:
+                    state = compileTail(transitions, add, expander.expandArrays(rule_name, *expand_years),
+                        index, gmt_off, save, zone_line.getFormat())
+                    if state:
+                        save, letters = state
+                        break
+                save, letters = rule_save, rule_letters
+                add(utc, gmt_off, save, letters)
+
+        if not until:
+            break
+        start = max(toUTC(until[0], until[1], gmt_off, save), window_start)
+        previous = (gmt_off, save)
+        if start >= window_end:
+            break
+    return transitions
+
+
+def transitionIndex(transitions, start, end, stride=INDEX_STRIDE):
+    """
+    Build a compiled zone's bucket index: one character per stride seconds
+    from start up to end (UTC seconds) whose code, less 48, is the index of
+    the transition in effect at the start of the bucket.  periods.js reads
+    it with charCodeAt and only steps on through the transitions for the
+    buckets which contain one.  None when the zone has a single transition.
+    """
+    if len(transitions) < 2:
+        return None
+    chars = []
+    i = 0
+    for bucket in range(start, end, stride):
+        while i + 1 < len(transitions) and transitions[i+1][0] <= bucket:
+            i += 1
+        chars.append(u"%c" % (48 + i))
+    return u"".join(chars)
+
+
+def compileTransitions(zones, rules, year_from, year_to):
+    """
+    Compile every zone to its UTC transitions, keyed by area and location
+    like the zones structure.  Linked zones share a single compiled list.
+    """
+    compiled = {}
+    transitions = {}
+    expander = RuleExpander(rules)
+    expander.prefill(year_from, year_to)
+    for area in zones.keys():
+        transitions[area] = {}
+        for location, zone in zones[area].items():
+            if id(zone) not in compiled:
+                compiled[id(zone)] = compileZone(zone, rules, year_from, year_to, expander)
+            transitions[area][location] = compiled[id(zone)]
+    return transitions
+
+
+def referenceYear(reference_date=None):
+    """
+    Return the year of a YYYY-MM-DD reference date.  Without one the build
+    date is used, taken from SOURCE_DATE_EPOCH when it's set so builds are
+    reproducible.
+    """
+    if reference_date:
+        return datetime.datetime.strptime(reference_date, "%Y-%m-%d").year
+    if os.environ.get("SOURCE_DATE_EPOCH"):
+        return time.gmtime(int(os.environ["SOURCE_DATE_EPOCH"]))[0]
+    return time.gmtime()[0]
 
-    return rules
 
+def parseTzData(source, window=None, jobs=1, cache_dir=None, profile=None, locations=None):
+    """
+    Parse zone.tab and every file of zone_files into zones and rules.
+
+    window is a (year_from, year_to) tuple, zones and rules outside it are
+    pruned.  When it's None the complete history is kept.  A Profile, when
+    given, collects the statistics of each file.  A locations list collects
+    the ZoneLocation of each zone.tab row.
+    """
+    zones = parseZoneFile(source, locations)
+
+    rules = {}
+    link_records = []
+    for filename, records in zip(zone_files, readTzFiles(source, zone_files, readRuleZoneFile, jobs, cache_dir, profile)):
+        counts = profile and profile.getCounts(filename)
+        rules.update( mergeRuleZoneRecords(records, zones, rules, window, link_records, counts) )
+
+    # Links may refer to zones of any file, so they're resolved once all the files are merged.
+    resolveLinks(zones, link_records)
+    return zones, rules
+
+
+class TzDatabase(object):
+    """
+    Query the tz database from Python.  Each zone is compiled to its UTC
+    transitions on first use, lookups then use a binary search over them.
+
+    Zone names are case insensitive 'Area/Location' names, Links included.
+    Timestamps are seconds since midnight 1st Jan 1970 UTC.
+
+        db = TzDatabase("tzdata2013i.tar.gz", year_from=2013)
+        db.utcoffset("Europe/Paris", 1372680000)    # 7200
+        db.abbreviation("Europe/Paris", 1372680000) # 'CEST'
+    """
+    def __init__(self, tzpath, year_from=None, year_to=DEFAULT_TO_YEAR, jobs=1, cache_dir=None):
+        source = TzSource(tzpath)
+        self.locations = []
+        try:
+            self.zones, self.rules = parseTzData(source, None, jobs, cache_dir, locations=self.locations)
+        finally:
+            source.close()
+        self.locator = ZoneLocator(self.locations)
+        if year_from is None:
+            year_from = referenceYear()
+        self.year_from = year_from
+        self.year_to = year_to
+        self.compiled = {}
+        self.expander = RuleExpander(self.rules)
+        self.expander.prefill(year_from, year_to)
+        self.arrays = {}
+        # Abbreviations shared by every zone so batch results of different zones can be compared.
+        self.abbreviation_table = AbbreviationTable()
+        self.abbreviations = self.abbreviation_table.abbreviations
+
+
+    def getZone(self, zone):
+        """
+        Return the zone lines of a zone name.  Raises KeyError for unknown zones.
+        """
+        area, location = (zone.lower().split("/", 1) + [None])[:2]
+        if area not in self.zones or location not in self.zones[area]:
+            raise KeyError("Unknown zone '%s'" % zone)
+        return self.zones[area][location]
+
+
+    def getTransitions(self, zone):
+        """
+        Return a zone's ([UTC instants], [transitions]), compiled once and
+        shared by the zones linked to it.
+        """
+        zone_lines = self.getZone(zone)
+        if id(zone_lines) not in self.compiled:
+            transitions = compileZone(zone_lines, self.rules, self.year_from, self.year_to, self.expander)
+            self.compiled[id(zone_lines)] = ([t[0] for t in transitions], transitions)
+        return self.compiled[id(zone_lines)]
+
+
+    def lookup(self, zone, timestamp):
+        """
+        Return the [UTC instant, UTC offset, daylight savings offset,
+        abbreviation] transition in effect at timestamp.  Raises ValueError
+        for times before the compiled years, which start with year_from.
+        """
+        instants, transitions = self.getTransitions(zone)
+        if not transitions:
+            raise KeyError("Zone '%s' has no data" % zone)
+        index = bisect.bisect_right(instants, timestamp) - 1
+        if index < 0:
+            raise ValueError("Timestamp %s is before the compiled years, which start in %d" % (timestamp, self.year_from))
+        return transitions[index]
+
+
+    def utcoffset(self, zone, timestamp):
+        """
+        Return the total UTC offset in seconds in effect at timestamp.
+        """
+        return self.lookup(zone, timestamp)[1]
+
+
+    def abbreviation(self, zone, timestamp):
+        """
+        Return the zone abbreviation in effect at timestamp, e.g. 'CEST'.
+        """
+        return self.lookup(zone, timestamp)[3]
+
+
+    def nextTransition(self, zone, timestamp):
+        """
+        Return the UTC instant of the first transition after timestamp, or
+        None when there's none before the end of the compiled years.  Raises
+        ValueError for times before the compiled years, like lookup.
+        """
+        instants, transitions = self.getTransitions(zone)
+        index = bisect.bisect_right(instants, timestamp)
+        if index == 0 and instants:
+            raise ValueError("Timestamp %s is before the compiled years, which start in %d" % (timestamp, self.year_from))
+        return instants[index] if index < len(instants) else None
+
+
+    def transitions(self, zone, start, end):
+        """
+        Return the transitions which occur from start up to, but excluding, end.
+        """
+        instants, transitions = self.getTransitions(zone)
+        # The first entry is the state at the start of the compiled years, not a transition.
+        return transitions[max(bisect.bisect_left(instants, start), 1):bisect.bisect_left(instants, end)]
+
+
+    def nearestZone(self, latitude, longitude):
+        """
+        Return the name of the zone whose zone.tab location is closest to
+        the coordinates in decimal degrees, e.g. 'Europe/Paris'.
+        """
+        return self.locator.nearestZone(latitude, longitude)
+
+
+    def zonesForCountry(self, country_code):
+        """
+        Return the zone names of an ISO 3166 country code, e.g. 'NZ'.
+        """
+        return self.locator.zonesForCountry(country_code)
+
+
+    def getArrays(self, zone):
+        """
+        Return a zone's transitions as numpy arrays of (UTC instants, UTC
+        offsets, daylight savings flags, indexes into self.abbreviations).
+        """
+        zone_lines = self.getZone(zone)
+        if id(zone_lines) not in self.arrays:
+            instants, transitions = self.getTransitions(zone)
+            if not transitions:
+                raise KeyError("Zone '%s' has no data" % zone)
+            self.arrays[id(zone_lines)] = (
+                numpy.array(instants, dtype=numpy.int64),
+                numpy.array([t[1] for t in transitions], dtype=numpy.int32),
+                numpy.array([t[2] != 0 for t in transitions], dtype=numpy.bool_),
+                numpy.array([self.abbreviation_table.intern(t[3]) for t in transitions], dtype=numpy.int32))
+        return self.arrays[id(zone_lines)]
+
+
+    def searchArray(self, instants, timestamps):
+        """
+        Return the indexes of the transitions in effect at each timestamp,
+        raises ValueError when any is before the compiled years.
+        """
+        index = numpy.searchsorted(instants, timestamps, side="right") - 1
+        if index.size and index.min() < 0:
+            raise ValueError("Timestamp %s is before the compiled years, which start in %d"
+                % (timestamps.flat[numpy.argmin(index)], self.year_from))
+        return index
+
+
+    def lookupArray(self, zones, timestamps):
+        """
+        Batch version of lookup for numpy arrays.  zones is either one zone
+        name or an array of zone names parallel to timestamps.  Returns
+        arrays of (UTC offsets, daylight savings flags, abbreviation indexes),
+        the abbreviations themselves are self.abbreviations[index].  Raises
+        ValueError when any timestamp is before the compiled years.
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for batch lookups")
+        timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+
+        if isinstance(zones, (str, type(u""))):
+            instants, offsets, dst, abbreviations = self.getArrays(zones)
+            index = self.searchArray(instants, timestamps)
+            return offsets[index], dst[index], abbreviations[index]
+
+        zones = numpy.asarray(zones)
+        if zones.shape != timestamps.shape:
+            raise ValueError("zones and timestamps must have the same shape")
+        result_offsets = numpy.empty(timestamps.shape, dtype=numpy.int32)
+        result_dst = numpy.empty(timestamps.shape, dtype=numpy.bool_)
+        result_abbreviations = numpy.empty(timestamps.shape, dtype=numpy.int32)
+
+        # Group the timestamps by zone so each zone is searched once with all of its timestamps.
+        names, inverse = numpy.unique(zones, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = numpy.argsort(inverse, kind="stable")
+        bounds = numpy.searchsorted(inverse[order], numpy.arange(len(names) + 1))
+        flat_timestamps = timestamps.reshape(-1)
+        for i, name in enumerate(names):
+            positions = order[bounds[i]:bounds[i+1]]
+            instants, offsets, dst, abbreviations = self.getArrays(str(name))
+            index = self.searchArray(instants, flat_timestamps[positions])
+            result_offsets.flat[positions] = offsets[index]
+            result_dst.flat[positions] = dst[index]
+            result_abbreviations.flat[positions] = abbreviations[index]
+        return result_offsets, result_dst, result_abbreviations
+
+
+class LRUCache(object):
+    """
+    Keep the size most recently used values, shared by the threads of the
+    service.  Values are computed outside the lock, two threads missing the
+    same key both compute it and the last one is kept.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                # Moved to the end, the least recently used entry stays first.
+                value = self.entries.pop(key)
+                self.entries[key] = value
+                self.hits += 1
+                return value
+        value = compute()
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+
+def tzSignature(tzpath):
+    """
+    Return the (name, mtime, size) of a tarball or of each tzdata file of a
+    directory, which changes whenever a new release is put in its place.
+    """
+    if not os.path.isdir(tzpath):
+        stat = os.stat(tzpath)
+        return [(tzpath, stat.st_mtime, stat.st_size)]
+    signature = []
+    for filename in ["zone.tab"] + zone_files:
+        path = os.path.join(tzpath, filename)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append( (filename, stat.st_mtime, stat.st_size) )
+    return signature
+
+
+class TzService(object):
+    """
+    Answer batches of (zone, timestamp) queries for --serve.  The tz
+    database is parsed once and each zone is resolved one UTC year at a
+    time on demand, the resolutions of the hot (zone, year) pairs are kept
+    in an LRU cache, so any year can be queried with bounded memory.
+
+    The database and its cache are replaced together when the tzdata
+    changes.  A batch uses the pair current when it starts, so batches in
+    flight during a reload finish with the data they started with.
+    """
+    def __init__(self, tzpath, lru_size=DEFAULT_LRU_SIZE, jobs=1, cache_dir=None):
+        self.tzpath = tzpath
+        self.lru_size = lru_size
+        self.jobs = jobs
+        self.cache_dir = cache_dir
+        self.signature = None
+        self.current = None
+        self.load()
+
+
+    def load(self):
+        """
+        Parse the tzdata and swap it in, the signature is taken first so a
+        change made while parsing is picked up by the next check.
+        """
+        signature = tzSignature(self.tzpath)
+        db = TzDatabase(self.tzpath, jobs=self.jobs, cache_dir=self.cache_dir)
+        self.current = (db, LRUCache(self.lru_size))
+        self.signature = signature
+        logging.info( "Loaded %s", self.tzpath )
+
+
+    def reloadIfChanged(self):
+        """
+        Reload when the tzdata changed since it was loaded.  A release which
+        can't be parsed, e.g. one being copied in place, is logged and the
+        current data stays in use until the next check.
+        """
+        try:
+            if tzSignature(self.tzpath) == self.signature:
+                return False
+            self.load()
+        except (IOError, OSError, ValueError, KeyError, tarfile.TarError) as e:
+            logging.error( "Keeping the current data, reloading %s failed: %s", self.tzpath, e )
+            return False
+        return True
+
+
+    def watch(self, interval):
+        while True:
+            time.sleep(interval)
+            self.reloadIfChanged()
+
+
+    @staticmethod
+    def compileYear(db, zone_lines, year):
+        """
+        Return a zone's ([UTC instants], [transitions]) in effect during a
+        UTC year.  Local times near New Year fall in the neighbouring UTC
+        years, so those are compiled too and trimmed off.
+
+        Years outside the database's window are expanded with a throwaway
+        RuleExpander, so only the LRU keeps anything for them.
+        """
+        year_from, year_to = max(year - 1, 1), min(year + 1, MAX_YEAR - 1)
+        expander = db.expander
+        if year_from < db.year_from or year_to > db.year_to:
+            expander = RuleExpander(db.rules)
+        transitions = compileZone(zone_lines, db.rules, year_from, year_to, expander)
+        instants = [t[0] for t in transitions]
+        first = max(bisect.bisect_right(instants, calendar.timegm((year, 1, 1, 0, 0, 0))) - 1, 0)
+        last = bisect.bisect_left(instants, calendar.timegm((year + 1, 1, 1, 0, 0, 0)))
+        return instants[first:last], transitions[first:last]
+
+
+    def resolve(self, db, cache, zone, timestamp):
+        """
+        Return the [UTC offset, daylight savings offset, abbreviation] of a
+        zone at timestamp.  Raises KeyError for unknown zones and ValueError
+        for timestamps out of range.
+        """
+        zone_lines = db.getZone(zone)
+        try:
+            year = time.gmtime(timestamp)[0]
+        except (OverflowError, OSError):
+            year = 0
+        if not 1 <= year < MAX_YEAR:
+            raise ValueError("Timestamp %s is out of range" % timestamp)
+        instants, transitions = cache.get( (id(zone_lines), year), lambda: self.compileYear(db, zone_lines, year) )
+        if not transitions:
+            raise KeyError("Zone '%s' has no data" % zone)
+        return transitions[max(bisect.bisect_right(instants, timestamp) - 1, 0)][1:]
+
+
+    def query(self, queries):
+        """
+        Answer a list of [zone, timestamp] pairs with a parallel list of
+        resolve results, a {"error": message} for the pairs which fail.
+        """
+        db, cache = self.current
+        results = []
+        for query in queries:
+            try:
+                if not isinstance(query, list) or len(query) != 2 or isinstance(query[1], bool) \
+                        or not isinstance(query[0], (str, type(u""))) or not isinstance(query[1], numbers.Real):
+                    raise ValueError("Expected a [zone, timestamp] pair, got %s" % json.dumps(query))
+                results.append( self.resolve(db, cache, query[0], query[1]) )
+            except (KeyError, ValueError) as e:
+                results.append( {"error": e.args[0]} )
+        return results
+
+
+class TzRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Each line a client sends is a JSON list of [zone, timestamp] pairs, it
+    is answered with a line holding the JSON list of TzService.query.
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                queries = json.loads(nativeString(line))
+                if not isinstance(queries, list):
+                    raise ValueError("Expected a list of [zone, timestamp] pairs")
+                response = self.server.service.query(queries)
+            except ValueError as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class TzTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class TzUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def serve(service, address, reload_interval):
+    """
+    Serve a TzService on a Unix domain socket, an address containing a
+    "/", or on a localhost TCP port, "PORT" or "HOST:PORT", until
+    interrupted.  The tzdata is checked for changes every reload_interval
+    seconds.
+    """
+    if "/" in address:
+        if not hasattr(socketserver, "UnixStreamServer"):
+            raise ValueError("Unix domain sockets aren't supported on this platform")
+        # A socket left behind by a previous run is replaced.
+        if os.path.exists(address):
+            os.unlink(address)
+        server = TzUnixServer(address, TzRequestHandler)
+    else:
+        host, port = ("127.0.0.1:" + address if ":" not in address else address).rsplit(":", 1)
+        server = TzTCPServer((host, int(port)), TzRequestHandler)
+    server.service = service
+
+    if reload_interval > 0:
+        watcher = threading.Thread(target=service.watch, args=(reload_interval,))
+        watcher.daemon = True
+        watcher.start()
+    logging.info( "Serving %s on %s", service.tzpath, address )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if "/" in address and os.path.exists(address):
+            os.unlink(address)
+
+
+def main():
+    global DEBUG
+    logging.basicConfig( )#level=logging.DEBUG ) # Numeric logging level for the message (DEBUG, INFO, WARNING, ERROR, CRITICAL).
+    DEBUG = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    parser = argparse.ArgumentParser(description="IANA timezone database parser to native javascript data structure.")
+    parser.add_argument("tzpath", help="path to tzdata directory or tzdata release tarball (.tar, .tar.gz, .tar.lz)")
+    parser.add_argument("--compile", action="store_true",
+        help="resolve each zone's rules into a sorted list of UTC transitions instead of emitting the raw zones and rules")
+    parser.add_argument("--zones", action="append", default=[], metavar="NAMES",
+        help="comma separated zone names or glob patterns to emit, e.g. europe/paris,america/*")
+    parser.add_argument("--areas", action="append", default=[], metavar="AREAS",
+        help="comma separated zone areas to emit, e.g. europe,asia")
+    parser.add_argument("--format", choices=["json", "packed"], default="json",
+        help="json emits plain objects, packed emits delta encoded strings with a shared string table which periods.js decodes on first use")
+    parser.add_argument("--cache-dir", metavar="DIR",
+        help="cache the parsed records of each tzdata file under a hash of its content, only changed files are parsed again")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+        help="parse the zone files in N worker processes, 0 uses one per CPU")
+    parser.add_argument("--from-year", type=int, metavar="YEAR",
+        help="first year of the output window, defaults to the year of the reference date")
+    parser.add_argument("--to-year", type=int, default=DEFAULT_TO_YEAR, metavar="YEAR",
+        help="last year of the output window (default: %(default)s)")
+    parser.add_argument("--output", "-o", metavar="PATH",
+        help="write the output to PATH instead of stdout")
+    parser.add_argument("--gzip", action="store_true",
+        help="gzip the output, implied when the --output path ends with .gz")
+    parser.add_argument("--profile", action="store_true",
+        help="report the parse time and records kept of each tzdata file and the bytes written for each zone and rule set on stderr")
+    parser.add_argument("--full-history", action="store_true",
+        help="keep every zone line and rule since %d, so past dates can be looked up" % MIN_YEAR)
+    parser.add_argument("--reference-date", metavar="YYYY-MM-DD",
+        help="date the window starts from when --from-year isn't given, defaults to SOURCE_DATE_EPOCH or today")
+    parser.add_argument("--index", action="store_true",
+        help="with --compile, also emit transition_index, a bucket per month of the window holding the transition in effect, so periods.js finds most transitions with one array access")
+    parser.add_argument("--locations", action="store_true",
+        help="also emit zone_locations, the zone.tab country codes and coordinates of the zones as a k-d tree for nearestZone and zonesForCountry in periods.js")
+    parser.add_argument("--serve", metavar="ADDRESS",
+        help="instead of writing the output, answer batches of [zone, timestamp] queries on a Unix domain socket path or a localhost PORT or HOST:PORT")
+    parser.add_argument("--lru-size", type=int, default=DEFAULT_LRU_SIZE, metavar="N",
+        help="with --serve, the number of (zone, year) resolutions kept in memory (default: %(default)s)")
+    parser.add_argument("--reload-interval", type=float, default=5, metavar="SECONDS",
+        help="with --serve, how often the tzdata is checked for changes and reloaded, 0 never reloads (default: %(default)s)")
+    parser.add_argument("--delta-from", metavar="OLD_TZPATH",
+        help="emit a patch of the zones, rule sets and links which changed since the OLD_TZPATH release, built with the same options, instead of the complete data")
+    args = parser.parse_args()
+
+    if args.full_history and args.from_year is not None:
+        parser.error("--full-history and --from-year are mutually exclusive")
+    try:
+        year_from = args.from_year if args.from_year is not None else referenceYear(args.reference_date)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.full_history:
+        year_from = MIN_YEAR
+    if year_from > args.to_year:
+        parser.error("--from-year is after --to-year")
+    if args.index and not args.compile:
+        parser.error("--index requires --compile")
+    if args.serve and (args.delta_from or args.output):
+        parser.error("--serve writes no output, it can't be combined with --output or --delta-from")
+    window = (year_from, args.to_year)
+
+    profile = args.profile and Profile() or None
+
+    zone_names = [name for names in args.zones for name in names.split(",") if name]
+    zone_areas = [area for areas in args.areas for area in areas.split(",") if area]
+    jobs = args.jobs or multiprocessing.cpu_count()
+
+    if args.serve:
+        try:
+            service = TzService(args.tzpath, max(args.lru_size, 1), jobs, args.cache_dir)
+            serve(service, args.serve, args.reload_interval)
+        except (IOError, OSError, ValueError) as e:
+            logging.critical(e)
+            sys.exit(2)
+        return
+
+    # A tarball is read in place, a directory holds the extracted tzdata files.
+    # Links are emitted once as aliases rather than as copies of their target's data.
+    # Compiling needs the complete history to establish the state at the start of the window.
+    locations, old_locations = [], []
+    try:
+        zones, rules, links = loadTzData(args.tzpath, None if args.compile else window, jobs, args.cache_dir, profile, zone_names, zone_areas, locations)
+        if args.delta_from:
+            old = loadTzData(args.delta_from, None if args.compile else window, jobs, args.cache_dir, None, zone_names, zone_areas, old_locations)
+    except IOError as e:
+        logging.critical(e)
+        sys.exit(2)
+    # Laid out as the k-d tree periods.js searches.
+    locations = ZoneLocator(locations).locations
+
+    # Zones and rule sets are packed or compiled as they're written.
+    writer = JsWriter(args.output, args.gzip or (args.output or "").endswith(".gz"), profile)
+    if args.delta_from:
+        patch = buildPatch(old, (zones, rules, links), window, args.compile, args.format == "packed", args.index)
+        if args.locations and [l.toJSON() for l in locations] != [l.toJSON() for l in ZoneLocator(old_locations).locations]:
+            patch["zone_locations"] = locations
+        writer.writePatch(patch)
+    else:
+        writer.writeVariable("links", links)
+        if args.locations:
+            writer.writeVariable("zone_locations", locations)
+        if args.compile:
+            expander = RuleExpander(rules)
+            expander.prefill(window[0], window[1])
+            table = AbbreviationTable()
+            index_start = calendar.timegm((window[0], 1, 1, 0, 0, 0))
+            index_end = calendar.timegm((window[1] + 1, 1, 1, 0, 0, 0))
+            indexes = {}
+            def compileIndexed(zone):
+                transitions = compileZone(zone, rules, window[0], window[1], expander)
+                if args.index:
+                    # Only the small index strings are kept until the transitions are written.
+                    indexes[id(zone)] = transitionIndex(transitions, index_start, index_end)
+                return table.indexTransitions(transitions)
+            if args.format == "packed":
+                encoder = PackedEncoder()
+                writer.writeVariable("transitions", zones, 2, lambda zone: encoder.packTransitions(compileIndexed(zone)))
+            else:
+                writer.writeVariable("transitions", zones, 2, compileIndexed)
+            # Transitions reference their abbreviation by its index in this table.
+            writer.writeVariable("tz_abbreviations", table.abbreviations)
+            if args.index:
+                writer.writeVariable("transition_index_start", index_start)
+                writer.writeVariable("transition_index_stride", INDEX_STRIDE)
+                writer.writeVariable("transition_index", zones, 2, lambda zone: indexes[id(zone)])
+        elif args.format == "packed":
+            encoder = PackedEncoder()
+            writer.writeVariable("zones", zones, 2, encoder.packZone)
+            writer.writeVariable("rules", rules, 1, encoder.packRules)
+            # periods.js only reads the string table when a zone is first looked up, so it can come last.
+            writer.writeVariable("tz_strings", encoder.strings)
+        else:
+            writer.writeVariable("zones", zones, 2)
+            writer.writeVariable("rules", rules, 1)
+    writer.close()
+
+    if profile:
+        profile.report(sys.stderr)
 
-zones = parseZoneFile()
 
-rules = {}
-for zone_file in zone_files:
-    rules.update( parseRuleZoneFile(zone_file, zones, rules) )
+if __name__ == "__main__":
+    main()
 
-print "zones =",json.dumps(zones, cls=jsonEncoderHelper) # , indent=4
-print "rules =",json.dumps(rules, cls=jsonEncoderHelper)
 
 #~ for rk in rules.keys():
     #~ print "Rule [%s]" % rk